@@ -0,0 +1,89 @@
+"""
+Compare serial, raced and routed Pollinations attempts against a local stub.
+Routed races only the routes composer.routing ranks best, learning as it goes.
+
+The stub (benchmarks/stubs.py) mimics the image endpoint with a per-model
+latency and error rate, so the numbers reflect the fetch strategy rather than
+the real provider:
+
+    python benchmarks/bench_pollinations_race.py --requests 100 --image-latency 0.3
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scene_composer.settings')
+
+import django  # noqa: E402
+
+import stubs  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(fetch, select_routes, requests_count, deadline):
+    latencies, failures = [], 0
+    for i in range(requests_count):
+        started = time.monotonic()
+        result = fetch(f"benchmark prompt {i}", select_routes(), 512, 512, i, started + deadline)
+        latencies.append(time.monotonic() - started)
+        if result:
+            os.remove(result[1])
+        else:
+            failures += 1
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--deadline', type=float, default=10, help='Overall deadline per request (seconds)')
+    parser.add_argument('--seed', type=int, default=1)
+    stubs.add_arguments(parser)
+    args = parser.parse_args()
+
+    # Stubs first: forking after Django has opened connections is not safe
+    random.seed(args.seed)
+    stub_process, pollinations_url, _ = stubs.start_in_subprocess(*stubs.profiles_from_args(args))
+
+    try:
+        from django.conf import settings
+        settings.LOGGING['loggers']['composer']['level'] = 'WARNING'  # Keep per-attempt logs out of the table
+        django.setup()
+        from django.test import override_settings
+        from composer.routing import ImageRouter
+        from composer.services import ImageGenerationService
+
+        # routed: race only the POLLINATIONS_RACE_WIDTH routes ImageRouter currently ranks best
+        modes = (
+            ('serial', ImageGenerationService._fetch_serial, ImageRouter.routes),
+            ('raced', ImageGenerationService._fetch_raced, ImageRouter.routes),
+            ('routed', ImageGenerationService._fetch_raced, lambda: ImageGenerationService._select_routes(512, 512)),
+        )
+        results = {}
+        with tempfile.TemporaryDirectory(prefix='scene-composer-race-') as media_root, \
+                override_settings(MEDIA_ROOT=media_root, POLLINATIONS_API_URL=pollinations_url,
+                                  POLLINATIONS_RACE_MODELS=True):
+            for name, fetch, select_routes in modes:
+                results[name] = run(fetch, select_routes, args.requests, args.deadline)
+    finally:
+        stub_process.terminate()
+
+    print(f"{args.requests} requests per mode, median default-model latency {args.image_latency}s")
+    print(f"{'mode':<8}{'p50':>10}{'p99':>10}{'mean':>10}{'failed':>8}")
+    for name, (latencies, failures) in results.items():
+        print(f"{name:<8}{percentile(latencies, 50):>9.3f}s{percentile(latencies, 99):>9.3f}s"
+              f"{statistics.mean(latencies):>9.3f}s{failures:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure worker cold start: each run is a fresh interpreter that imports the
+settings, boots Django, loads the URLconf and views, and serves one request.
+The Gemini SDK import, deferred until the first AI call, is timed separately.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ['settings', 'django_setup', 'urls_and_views', 'first_request', 'total', 'gemini_sdk']
+
+
+def measure():
+    """One cold start, in this (fresh) process; prints the phase timings as JSON"""
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scene_composer.settings')
+    timings = {}
+    started = last = time.perf_counter()
+
+    def mark(phase):
+        nonlocal last
+        now = time.perf_counter()
+        timings[phase] = now - last
+        last = now
+
+    import django
+    from django.conf import settings
+    settings.INSTALLED_APPS  # Forces the settings module import
+    mark('settings')
+
+    django.setup()
+    mark('django_setup')
+
+    import composer.urls  # noqa: F401
+    mark('urls_and_views')
+
+    from django.test import Client
+    settings.ALLOWED_HOSTS = ['testserver']
+    response = Client().get('/')
+    assert response.status_code == 200, response.status_code
+    mark('first_request')
+    timings['total'] = last - started
+
+    import google.generativeai  # noqa: F401
+    mark('gemini_sdk')
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+
+    samples = {phase: [] for phase in PHASES}
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure'],
+            check=True, capture_output=True, text=True, cwd=ROOT,
+        ).stdout
+        # The last line is ours; anything before it is startup logging
+        timings = json.loads(output.strip().splitlines()[-1])
+        for phase in PHASES:
+            samples[phase].append(timings[phase])
+
+    print(f"{args.runs} cold starts")
+    print(f"{'phase':<16}{'median':>10}{'min':>10}{'max':>10}")
+    for phase in PHASES:
+        values = samples[phase]
+        print(f"{phase:<16}{statistics.median(values) * 1000:>8.1f}ms{min(values) * 1000:>8.1f}ms"
+              f"{max(values) * 1000:>8.1f}ms")
+    print("gemini_sdk is paid on the first AI call, not at startup")
+
+
+if __name__ == '__main__':
+    main()
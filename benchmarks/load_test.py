@@ -0,0 +1,331 @@
+"""
+Offline load test: drive the backgrounds, characters, create_scene and
+my_scenes views concurrently against stubbed providers (benchmarks/stubs.py)
+and report latency percentiles, throughput and peak RSS.
+
+The app runs in this process on a throwaway database and media directory,
+with in-process generation workers draining the job queue, so the numbers
+cover the request path and the end-to-end generation time:
+
+    python benchmarks/load_test.py --concurrency 16 --requests 400
+    python benchmarks/load_test.py --mix my_scenes=1 --json baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scene_composer.settings')
+
+import django  # noqa: E402
+
+import stubs  # noqa: E402
+
+SCENARIOS = ['backgrounds', 'characters', 'create_scene', 'my_scenes']
+DESCRIPTIONS = [
+    'a misty forest at dawn', 'a neon city street in the rain', 'a quiet beach at sunset',
+    'a snowy mountain pass', 'an ancient library lit by candles', 'a desert oasis under stars',
+]
+CHARACTERS = ['a knight in silver armor', 'a wizard with a long staff', 'an archer in a green cloak', 'a rogue']
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None}
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': statistics.mean(latencies),
+    }
+
+
+def parse_mix(value):
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown view {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def configure(workdir, pollinations_url, gemini_endpoint, args):
+    """Point the settings at a throwaway database, media root and the stubs"""
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 30
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.DEBUG = False  # DEBUG keeps every query in memory, which would skew RSS
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.POLLINATIONS_API_URL = pollinations_url
+    settings.GEMINI_API_ENDPOINT = gemini_endpoint
+    settings.GOOGLE_API_KEY = 'benchmark'
+    settings.ASYNC_GENERATION_VIEWS = args.async_views
+    settings.ADMISSION_USER_BURST = args.user_burst
+    settings.LOGGING['loggers']['composer']['level'] = 'WARNING'
+
+
+def seed_users(count):
+    """One user per client, each owning a background and character to compose"""
+    from django.contrib.auth.models import User
+    from composer import rendering, storage
+    from composer.models import Background, Character
+
+    background_url = storage.save_image(
+        rendering.render_background_placeholder('benchmark background', 'background'), 'bench_background.png')
+    character_url = storage.save_image(
+        rendering.render_character_placeholder('benchmark character'), 'bench_character.png')
+
+    users = []
+    for i in range(count):
+        user = User.objects.create_user(f'bench{i}', password='bench')
+        background = Background.objects.create(
+            name='Seed background', description=DESCRIPTIONS[0], generated_image_url=background_url, created_by=user)
+        character = Character.objects.create(
+            name='Seed character', description=CHARACTERS[0], generated_image_url=character_url, created_by=user)
+        users.append((user, background, character))
+    return users
+
+
+def make_request(client, scenario, background, character, rng, repaint_share):
+    """One request; returns the response, or an awaitable of it for an AsyncClient"""
+    if scenario == 'backgrounds':
+        return client.post('/backgrounds/', {
+            'name': 'Load test background', 'description': f"{rng.choice(DESCRIPTIONS)} #{rng.random():.6f}",
+        })
+    if scenario == 'characters':
+        return client.post('/characters/', {
+            'name': 'Load test character', 'description': f"{rng.choice(CHARACTERS)} #{rng.random():.6f}",
+        })
+    if scenario == 'create_scene':
+        return client.post('/create-scene/', {
+            'title': 'Load test scene',
+            'background': background.id,
+            'character': character.id,
+            'character_position': rng.choice(['left', 'center', 'right']),
+            'action_description': 'standing and looking around',
+            'render_mode': 'repaint' if rng.random() < repaint_share else 'composite',
+        })
+    return client.get('/my-scenes/')
+
+
+def run_clients(users, args):
+    """Issue args.requests requests from one thread per user; returns samples and wall time"""
+    from django.db import connections
+    from django.test import Client
+
+    scenarios, weights = zip(*args.mix.items())
+    remaining = itertools.count()
+    samples, lock = [], threading.Lock()
+
+    def client_loop(index, user, background, character):
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client()
+        client.force_login(user)
+        try:
+            while next(remaining) < args.requests:
+                scenario = rng.choices(scenarios, weights)[0]
+                started = time.perf_counter()
+                try:
+                    ok = make_request(client, scenario, background, character, rng, args.repaint_share).status_code < 400
+                except Exception:
+                    ok = False
+                with lock:
+                    samples.append((scenario, time.perf_counter() - started, ok))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=client_loop, args=(i, *seed)) for i, seed in enumerate(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def run_async_clients(users, args):
+    """run_clients() for --async-views: every client is a coroutine on one
+    event loop, as under an ASGI server, so generations overlap on the loop
+    instead of each holding a thread"""
+    import asyncio
+    from asgiref.sync import sync_to_async
+    from django.test import AsyncClient
+
+    scenarios, weights = zip(*args.mix.items())
+    remaining = itertools.count()
+    samples = []
+
+    async def client_loop(index, user, background, character):
+        rng = random.Random(args.seed * 1000 + index)
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(user)
+        while next(remaining) < args.requests:
+            scenario = rng.choices(scenarios, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, scenario, background, character, rng, args.repaint_share)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            samples.append((scenario, time.perf_counter() - started, ok))
+
+    async def run_all():
+        await asyncio.gather(*(client_loop(i, *seed) for i, seed in enumerate(users)))
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    return samples, time.perf_counter() - started
+
+
+def start_workers(count, stop):
+    """Generation workers like `manage.py run_generation_worker`, as threads"""
+    from django.db import connections
+    from composer.services import GenerationJobService
+
+    def worker():
+        try:
+            while not stop.is_set():
+                job = GenerationJobService.claim_next()
+                if job is None:
+                    time.sleep(0.05)
+                else:
+                    GenerationJobService.run(job)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def wait_for_queue(timeout):
+    from composer.models import GenerationJob
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not GenerationJob.objects.filter(
+                status__in=[GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING]).exists():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def job_report():
+    """Terminal outcomes, plus the attempts they took. A job that failed and
+    then succeeded on a retry keeps no error, so retried is the only sign of it."""
+    from django.db.models import Sum
+    from composer.models import GenerationJob
+    jobs = GenerationJob.objects.exclude(finished_at=None).values_list('status', 'created_at', 'finished_at')
+    latencies = [(finished - created).total_seconds() for _, created, finished in jobs]
+    all_jobs = GenerationJob.objects.all()
+    return {
+        'finished': len(latencies),
+        'failed': sum(status == GenerationJob.STATUS_FAILED for status, _, _ in jobs),
+        'unfinished': all_jobs.filter(finished_at=None).count(),
+        'attempts': all_jobs.aggregate(total=Sum('attempts'))['total'] or 0,
+        'retried': all_jobs.filter(attempts__gt=1).count(),
+        **summarize(latencies),
+    }
+
+
+def print_report(report, out):
+    def ms(value):
+        return f"{value * 1000:>9.1f}ms" if value is not None else f"{'-':>11}"
+
+    print(f"{report['requests']} requests, {report['concurrency']} clients, {report['workers']} workers, "
+          f"{'async' if report['async_views'] else 'sync'} views", file=out)
+    print(f"{'view':<14}{'count':>7}{'errors':>8}{'p50':>11}{'p95':>11}{'p99':>11}", file=out)
+    for name, stats in report['views'].items():
+        print(f"{name:<14}{stats['count']:>7}{stats['errors']:>8}{ms(stats['p50'])}{ms(stats['p95'])}{ms(stats['p99'])}",
+              file=out)
+    jobs = report['jobs']
+    print(f"{'jobs':<14}{jobs['finished']:>7}{jobs['failed']:>8}{ms(jobs['p50'])}{ms(jobs['p95'])}{ms(jobs['p99'])}"
+          f"  ({jobs['unfinished']} unfinished)", file=out)
+    print(f"job attempts {jobs['attempts']}, {jobs['retried']} job(s) retried", file=out)
+    print(f"throughput {report['throughput']:.1f} req/s over {report['wall_time']:.1f}s, "
+          f"peak RSS {report['peak_rss_mb']:.1f} MB", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=8, help='Simultaneous clients (one user each)')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('backgrounds=1,characters=1,create_scene=1,my_scenes=2'),
+                        help='Weighted views, e.g. backgrounds=1,my_scenes=3')
+    parser.add_argument('--repaint-share', type=float, default=0.25, help='Share of scenes using AI repaint')
+    parser.add_argument('--workers', type=int, default=4, help='In-process generation workers (0 for none)')
+    parser.add_argument('--drain-timeout', type=float, default=120, help='Seconds to wait for queued jobs')
+    parser.add_argument('--async-views', action='store_true', help='Route generation to composer.async_views')
+    parser.add_argument('--user-burst', type=int, default=0,
+                        help='Per-user admission token bucket size (0, the default, turns rate limiting off)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the report to this file')
+    stubs.add_arguments(parser)
+    args = parser.parse_args()
+
+    # Stubs first: forking after Django has opened connections is not safe
+    random.seed(args.seed)
+    stub_process, pollinations_url, gemini_endpoint = stubs.start_in_subprocess(*stubs.profiles_from_args(args))
+    workdir = tempfile.mkdtemp(prefix='scene-composer-bench-')
+
+    try:
+        configure(workdir, pollinations_url, gemini_endpoint, args)
+        django.setup()
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        users = seed_users(args.concurrency)
+
+        stop = threading.Event()
+        start_workers(args.workers, stop)
+        samples, wall_time = (run_async_clients if args.async_views else run_clients)(users, args)
+        if args.workers:
+            wait_for_queue(args.drain_timeout)
+        stop.set()
+
+        views = {}
+        for name in args.mix:
+            latencies = [latency for scenario, latency, _ in samples if scenario == name]
+            views[name] = {
+                'count': len(latencies),
+                'errors': sum(1 for scenario, _, ok in samples if scenario == name and not ok),
+                **summarize(latencies),
+            }
+        report = {
+            'requests': len(samples),
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'async_views': args.async_views,
+            'wall_time': wall_time,
+            'throughput': len(samples) / wall_time,
+            'views': views,
+            'jobs': job_report(),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KB on Linux
+        }
+        print_report(report, sys.stdout)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        stub_process.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Local stand-ins for the Pollinations image endpoint and Gemini's
+generateContent, so benchmarks never touch the real providers.
+
+Each stub has a latency (median seconds, log-normally jittered), an error
+rate and, for Pollinations, a payload size. Run them on their own:
+
+    python benchmarks/stubs.py --pollinations-port 8801 --gemini-port 8802
+
+then point the app at them with
+POLLINATIONS_API_URL=http://127.0.0.1:8801/prompt/,
+GEMINI_API_ENDPOINT=http://127.0.0.1:8802 and any GOOGLE_API_KEY.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import urllib.parse
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubProfile:
+    """Latency, error rate and payload size of one stubbed endpoint"""
+
+    def __init__(self, latency=1.0, error_rate=0.0, payload_bytes=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes  # None: whatever the JPEG encoder produces
+
+    def wait(self):
+        if self.latency:
+            time.sleep(random.lognormvariate(0, 0.5) * self.latency)
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+
+@lru_cache(maxsize=16)
+def make_image(width, height, payload_bytes=None):
+    """Noise JPEG of the requested size, padded after its end marker to payload_bytes"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, 'JPEG', quality=85)
+    data = buffer.getvalue()
+    if payload_bytes and len(data) < payload_bytes:
+        data += b'\0' * (payload_bytes - len(data))  # Decoders ignore bytes after EOI
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real providers
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def pollinations_handler(profiles):
+    """profiles: model name ('' for the default model) -> StubProfile"""
+
+    class PollinationsHandler(_Handler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            profile = profiles.get(query.get('model', [''])[0], profiles[''])
+            profile.wait()
+            if profile.fails():
+                self._send(502)
+                return
+            width = int(query.get('width', ['1024'])[0])
+            height = int(query.get('height', ['768'])[0])
+            self._send(200, make_image(width, height, profile.payload_bytes), 'image/jpeg')
+
+    return PollinationsHandler
+
+
+def gemini_handler(profile):
+    """Answers generateContent the way the REST API does. JSON-mode requests
+    with a JSON list in the prompt (batch enhancement) get a list back."""
+
+    class GeminiHandler(_Handler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            profile.wait()
+            if profile.fails():
+                self._send(503, b'{"error": {"code": 503, "message": "stub overloaded"}}', 'application/json')
+                return
+
+            prompt = request['contents'][-1]['parts'][0]['text']
+            text = f"Stub enhancement: {' '.join(prompt.split())[:200]}"
+            if request.get('generationConfig', {}).get('responseMimeType') == 'application/json':
+                items = re.search(r'\[.*\]', prompt, re.DOTALL)
+                items = json.loads(items.group(0)) if items else []
+                text = json.dumps([f"Stub enhancement: {item}" for item in items])
+
+            body = {
+                'candidates': [{
+                    'content': {'parts': [{'text': text}], 'role': 'model'},
+                    'finishReason': 'STOP',
+                    'index': 0,
+                }],
+                'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(text) // 4},
+            }
+            self._send(200, json.dumps(body).encode('utf-8'), 'application/json')
+
+    return GeminiHandler
+
+
+def serve(handler, port=0):
+    """Start a threaded stub server; returns it once it is listening"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _serve_forever(pollinations_profiles, gemini_profile, ports, ready):
+    servers = [
+        serve(pollinations_handler(pollinations_profiles), ports[0]),
+        serve(gemini_handler(gemini_profile), ports[1]),
+    ]
+    ready.send([server.server_port for server in servers])
+    threading.Event().wait()
+
+
+def start_in_subprocess(pollinations_profiles, gemini_profile, ports=(0, 0)):
+    """Run both stubs in a child process, so their work does not share the
+    benchmark's GIL. Returns (process, pollinations URL, Gemini endpoint)."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_serve_forever, args=(pollinations_profiles, gemini_profile, ports, sender), daemon=True,
+    )
+    process.start()
+    pollinations_port, gemini_port = receiver.recv()
+    return process, f"http://127.0.0.1:{pollinations_port}/prompt/", f"http://127.0.0.1:{gemini_port}"
+
+
+def add_arguments(parser):
+    """Stub knobs shared by the benchmarks"""
+    parser.add_argument('--image-latency', type=float, default=1.0, help='Median Pollinations latency (seconds)')
+    parser.add_argument('--image-error-rate', type=float, default=0.1)
+    parser.add_argument('--image-bytes', type=int, default=None, help='Pad images to this many bytes')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Median Gemini latency (seconds)')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+
+
+def profiles_from_args(args):
+    """(Pollinations profiles per model, Gemini profile); the alternative models
+    are faster and more reliable than the default one, as in production"""
+    image = lambda factor: StubProfile(  # noqa: E731
+        args.image_latency * factor, args.image_error_rate * factor, args.image_bytes,
+    )
+    pollinations = {'': image(1.0), 'flux': image(0.5), 'turbo': image(0.25)}
+    return pollinations, StubProfile(args.llm_latency, args.llm_error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pollinations-port', type=int, default=8801)
+    parser.add_argument('--gemini-port', type=int, default=8802)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    pollinations, gemini = profiles_from_args(args)
+    serve(pollinations_handler(pollinations), args.pollinations_port)
+    serve(gemini_handler(gemini), args.gemini_port)
+    print(f"Pollinations stub: http://127.0.0.1:{args.pollinations_port}/prompt/")
+    print(f"Gemini stub:       http://127.0.0.1:{args.gemini_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,50 @@
 from django.contrib import admin
-from .models import Background, Character, Scene
+from .models import Background, Character, Scene, GenerationJob, CachedImage, CachedPrompt, CircuitBreakerState, GenerationLease, RateLimitBucket
 
 @admin.register(Background)
 class BackgroundAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_by', 'created_at']
+    list_display = ['name', 'seed', 'created_by', 'created_at']
     list_filter = ['created_at', 'created_by']
     search_fields = ['name', 'description']
 
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_by', 'created_at']
+    list_display = ['name', 'seed', 'created_by', 'created_at']
     list_filter = ['created_at', 'created_by']
     search_fields = ['name', 'description']
 
 @admin.register(Scene)
 class SceneAdmin(admin.ModelAdmin):
-    list_display = ['title', 'background', 'character', 'character_position', 'created_by', 'created_at']
+    list_display = ['title', 'background', 'character', 'character_position', 'seed', 'created_by', 'created_at']
     list_filter = ['character_position', 'created_at', 'created_by']
     search_fields = ['title', 'action_description']
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'attempts', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['error']
+
+@admin.register(CachedImage)
+class CachedImageAdmin(admin.ModelAdmin):
+    list_display = ['path', 'size_bytes', 'hits', 'created_at', 'last_used_at']
+    search_fields = ['key', 'path']
+
+@admin.register(CachedPrompt)
+class CachedPromptAdmin(admin.ModelAdmin):
+    list_display = ['key', 'hits', 'created_at', 'expires_at']
+    search_fields = ['key', 'response']
+
+@admin.register(CircuitBreakerState)
+class CircuitBreakerStateAdmin(admin.ModelAdmin):
+    list_display = ['name', 'state', 'failure_count', 'success_count', 'opened_at', 'updated_at']
+
+@admin.register(GenerationLease)
+class GenerationLeaseAdmin(admin.ModelAdmin):
+    list_display = ['key', 'owner', 'created_at', 'expires_at']
+    search_fields = ['key']
+
+@admin.register(RateLimitBucket)
+class RateLimitBucketAdmin(admin.ModelAdmin):
+    list_display = ['key', 'tokens', 'updated_at']
+    search_fields = ['key']
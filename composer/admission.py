@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import deadlines, leases
+from .metrics import registry
+from .models import GenerationJob, RateLimitBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """A generation turned away for lack of capacity; retry_after is in seconds"""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        registry.inc('admission_rejections_total', reason=reason)
+
+
+class TokenBucket:
+    """Per-key token bucket stored in RateLimitBucket rows, so a user's
+    allowance is the same whichever process serves them. Holds up to
+    capacity tokens (ADMISSION_USER_BURST by default), refilled at rate per
+    second (ADMISSION_USER_RATE)."""
+
+    def __init__(self, name, rate=None, capacity=None):
+        self.name = name
+        self.rate = settings.ADMISSION_USER_RATE if rate is None else rate
+        self.capacity = settings.ADMISSION_USER_BURST if capacity is None else capacity
+
+    def consume(self, key, tokens=1):
+        """Spend tokens from key's bucket. Returns 0 if they were spent, otherwise
+        the seconds until enough will have refilled (nothing is spent then).
+        Raises ValueError for more tokens than the bucket can ever hold."""
+        if not self.capacity:
+            return 0
+        if tokens > self.capacity:
+            raise ValueError(f'At most {self.capacity} generations can be started at once')
+        bucket_key = f"{self.name}:{key}"
+        while True:
+            now = timezone.now()
+            bucket, _ = RateLimitBucket.objects.get_or_create(
+                key=bucket_key, defaults={'tokens': self.capacity, 'updated_at': now}
+            )
+            elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+            available = min(self.capacity, bucket.tokens + elapsed * self.rate)
+            if available < tokens:
+                return (tokens - available) / self.rate
+
+            # Lands only if nobody spent from the bucket since we read it; otherwise look again
+            spent = RateLimitBucket.objects.filter(pk=bucket.pk, updated_at=bucket.updated_at).update(
+                tokens=available - tokens, updated_at=now
+            )
+            if spent:
+                return 0
+
+
+class HeldSlot:
+    """A slot() claim. Released when the slot() block exits, or if
+    hold_until() handed it futures still running then, once the last of
+    those has finished: abandoned work still counts against the cap."""
+
+    def __init__(self, release):
+        self._release = release
+        self._lock = threading.Lock()
+        self._running = 0
+        self._open = True
+
+    def hold_until(self, futures):
+        """Keep the slot after the block exits until every one of futures is done"""
+        for future in futures:
+            with self._lock:
+                self._running += 1
+            future.add_done_callback(self._settled)
+
+    def _settled(self, future):
+        with self._lock:
+            self._running -= 1
+            last = not self._open and not self._running
+        if last:
+            # On the thread that ran the last future, which has no other use for the database
+            try:
+                self._release()
+            finally:
+                connections.close_all()
+
+    def _close(self):
+        with self._lock:
+            self._open = False
+            last = not self._running
+        if last:
+            self._release()
+
+
+class ConcurrencyLimiter:
+    """Cap on calls to a provider in flight across every process, with a
+    bounded queue of callers waiting for a slot.
+
+    Slots and queue places are GenerationLease rows, so a crashed holder's
+    slot frees itself when the lease lapses. A caller finding every slot
+    busy takes a queue place and polls for a slot for up to
+    ADMISSION_QUEUE_TIMEOUT seconds; with the queue full too it is turned
+    away at once. Either way it gets AdmissionRejected.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = settings.ADMISSION_PROVIDER_CONCURRENCY
+        self.queue_timeout = settings.ADMISSION_QUEUE_TIMEOUT
+        self.lease = settings.ADMISSION_SLOT_LEASE
+        self.slot_keys = [f"slot:{name}:{index}" for index in range(self.limit)]
+        self.queue_keys = [f"queue:{name}:{index}" for index in range(settings.ADMISSION_QUEUE_SIZE)]
+
+    @staticmethod
+    def _shuffled(keys):
+        # Concurrent callers start from different keys instead of all racing for the first
+        return random.sample(keys, len(keys))
+
+    def _acquire_slot(self, owner):
+        return leases.acquire_any(self._shuffled(self.slot_keys), owner, self.lease)
+
+    def _join_queue(self, owner):
+        ticket = leases.acquire_any(self._shuffled(self.queue_keys), owner, self.queue_timeout * 2)
+        if ticket is None:
+            raise AdmissionRejected(
+                f"Too many {self.name} requests are waiting", 'queue_full', self.queue_timeout
+            )
+        return ticket
+
+    def _timed_out(self):
+        return AdmissionRejected(
+            f"No {self.name} slot freed up within {self.queue_timeout}s", 'queue_timeout', self.queue_timeout
+        )
+
+    def _wait_allowed(self):
+        # Never past the request budget: better a placeholder than a late image
+        return deadlines.clamp(self.queue_timeout, reserve=settings.DEADLINE_PLACEHOLDER_RESERVE)
+
+    def _claim(self, owner):
+        slot = self._acquire_slot(owner)
+        if slot:
+            return slot
+
+        ticket = self._join_queue(owner)
+        try:
+            deadline = time.monotonic() + self._wait_allowed()
+            while time.monotonic() < deadline:
+                time.sleep(settings.ADMISSION_POLL_INTERVAL)
+                slot = self._acquire_slot(owner)
+                if slot:
+                    return slot
+            raise self._timed_out()
+        finally:
+            leases.release(ticket, owner)
+
+    async def _aclaim(self, owner):
+        slot = await sync_to_async(self._acquire_slot)(owner)
+        if slot:
+            return slot
+
+        ticket = await sync_to_async(self._join_queue)(owner)
+        try:
+            deadline = time.monotonic() + self._wait_allowed()
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.ADMISSION_POLL_INTERVAL)
+                slot = await sync_to_async(self._acquire_slot)(owner)
+                if slot:
+                    return slot
+            raise self._timed_out()
+        finally:
+            await sync_to_async(leases.release)(ticket, owner)
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the provider's slots for the duration of the block, or
+        longer if given work to outlast it (HeldSlot.hold_until)"""
+        if not self.limit:
+            yield HeldSlot(lambda: None)
+            return
+        owner = uuid.uuid4().hex
+        started = time.perf_counter()
+        key = self._claim(owner)
+        registry.observe('admission_wait_seconds', time.perf_counter() - started, provider=self.name)
+        held = HeldSlot(lambda: leases.release(key, owner))
+        try:
+            yield held
+        finally:
+            held._close()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """slot() for coroutines; waiting in the queue does not hold a thread"""
+        if not self.limit:
+            yield
+            return
+        owner = uuid.uuid4().hex
+        started = time.perf_counter()
+        key = await self._aclaim(owner)
+        registry.observe('admission_wait_seconds', time.perf_counter() - started, provider=self.name)
+        try:
+            yield
+        finally:
+            await sync_to_async(leases.release)(key, owner)
+
+
+def _check_backlog():
+    max_pending = settings.ADMISSION_MAX_PENDING_JOBS
+    if max_pending and GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING).count() >= max_pending:
+        raise AdmissionRejected(
+            'The generation queue is full. Please try again shortly.', 'backlog', settings.ADMISSION_QUEUE_TIMEOUT
+        )
+
+
+def _charge(bucket, user, tokens):
+    wait = bucket.consume(user.pk, tokens)
+    if wait:
+        logger.info("Rate limited %s for %.1fs", user, wait)
+        raise AdmissionRejected(
+            f'You are generating images too quickly. Please wait {math.ceil(wait)} seconds and try again.',
+            'rate_limited', wait,
+        )
+
+
+def admit(user, generations=1):
+    """Admit a request from user for that many generations (one token each) or
+    raise AdmissionRejected: when the job backlog is full, or the user's token
+    bucket is short. ValueError means the request is larger than the bucket."""
+    _check_backlog()
+    _charge(TokenBucket('generation'), user, generations)
+
+
+def admit_bulk(user, items):
+    """admit() for a bulk import of that many items, charged to the user's
+    separate bulk allowance (ADMISSION_BULK_BURST, ADMISSION_BULK_RATE)"""
+    _check_backlog()
+    bucket = TokenBucket('bulk', rate=settings.ADMISSION_BULK_RATE, capacity=settings.ADMISSION_BULK_BURST)
+    _charge(bucket, user, items)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ComposerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'composer'
+
+    def ready(self):
+        from . import signals  # noqa: F401
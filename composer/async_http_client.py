@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import logging
+import random
+import time
+import weakref
+
+from django.conf import settings
+
+from .http_client import retry_sleep_cap, timeout_for
+
+
+logger = logging.getLogger(__name__)
+
+# httpx clients are bound to the event loop that opened their connections
+_clients = weakref.WeakKeyDictionary()
+
+
+def _build_client():
+    # Imported on first use; only ASGI deployments with async views need it
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_POOL_MAXSIZE,
+    )
+    # Transport retries cover connection failures only; statuses are retried in stream()
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=settings.HTTP_RETRY_TOTAL)
+    return httpx.AsyncClient(transport=transport, follow_redirects=True)
+
+
+def get_client():
+    """Keep-alive client shared by everything running on the current event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _build_client()
+        logger.debug("Created async HTTP client for loop %#x", id(loop))
+    return client
+
+
+def _retry_delay(attempt, response, deadline=None):
+    """Seconds to wait before retrying, honouring Retry-After like the sync
+    session and capped the same way; None when deadline leaves no time to retry"""
+    if deadline is not None and time.monotonic() >= deadline:
+        return None
+    retry_after = response.headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        delay = int(retry_after)
+    else:
+        delay = settings.HTTP_RETRY_BACKOFF * 2 ** attempt + random.uniform(0, settings.HTTP_RETRY_JITTER)
+    return min(delay, retry_sleep_cap(deadline))
+
+
+@contextlib.asynccontextmanager
+async def stream(url, timeout=None):
+    """Streamed GET on the shared client; timeout caps the per-host timeouts
+    and the sleeps between retries. Retryable statuses (HTTP_RETRY_STATUSES)
+    are retried with backoff."""
+    import httpx
+
+    connect, read = timeout_for(url, timeout)
+    client = get_client()
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    for attempt in range(settings.HTTP_RETRY_TOTAL + 1):
+        request = client.build_request('GET', url, timeout=httpx.Timeout(read, connect=connect))
+        response = await client.send(request, stream=True)
+        if response.status_code not in settings.HTTP_RETRY_STATUSES or attempt == settings.HTTP_RETRY_TOTAL:
+            break
+        delay = _retry_delay(attempt, response, deadline)
+        if delay is None:
+            break  # Out of time: hand back this response rather than retry
+        await response.aclose()
+        await asyncio.sleep(delay)
+
+    try:
+        yield response
+    finally:
+        await response.aclose()
@@ -0,0 +1,190 @@
+import functools
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render, redirect
+from . import admission, thumbnails
+from .deadlines import with_request_budget
+from .models import Scene
+from .forms import BackgroundForm, CharacterForm, SceneForm
+from .services import AIService, GenerationJobService, ImageGenerationService, SceneCompositor
+from .views import _library_page, _queued_variants, _too_many_requests
+
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the generation views, routed in place of the queue-backed
+# ones when ASYNC_GENERATION_VIEWS is on (ASGI deployments only). Generation
+# runs inline: while a provider is slow the request is a suspended coroutine
+# rather than a blocked thread. Database and template work goes through
+# sync_to_async, since lazy querysets and the session cannot run on the loop.
+
+def async_login_required(view):
+    """login_required for async views; Django 4.2's decorator only wraps sync ones"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Resolving the lazy user reads the session and the database
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+def _render_library(request, kind, form, rejection=None):
+    items, next_cursor = _library_page(request, kind)
+    context = {
+        kind: items,
+        'next_cursor': next_cursor,
+        'form': form
+    }
+    if rejection:
+        return _too_many_requests(request, rejection, f'composer/{kind}.html', context)
+    return render(request, f'composer/{kind}.html', context)
+
+async def _admit(request, generations=1):
+    """The AdmissionRejected for this request, or None if it may go ahead"""
+    try:
+        await sync_to_async(admission.admit)(request.user, generations)
+    except admission.AdmissionRejected as e:
+        return e
+    return None
+
+async def _build_thumbnails(image_url):
+    try:
+        await sync_to_async(thumbnails.build_derivatives, thread_sensitive=False)(image_url)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", image_url)
+
+async def _queue_variants(request, item, variants, label):
+    """Variants mode goes to the worker, which generates the seeds in parallel
+    and keeps them on the job until the user has picked one"""
+    job = await sync_to_async(GenerationJobService.enqueue)(item, request.user, variants=variants)
+    return await sync_to_async(_queued_variants)(request, job, label)
+
+async def _generate_library_image(request, item, label):
+    """Enhance the description, generate the image and save it on item"""
+    try:
+        item.enhanced_description = await AIService.instance().aenhance_description(item.description)
+        item.generated_image_url, item.seed = await ImageGenerationService.agenerate_seeded(
+            label, item.enhanced_description
+        )
+    except admission.AdmissionRejected:
+        # Every provider slot is taken: hand the image to the worker queue instead
+        await sync_to_async(GenerationJobService.enqueue)(item, request.user)
+        messages.success(request, f'{label.title()} queued! Your image will appear here once it has been generated.')
+        return
+    except Exception as e:
+        logger.exception("Error in %s generation", label)
+        messages.error(request, f'An error occurred during {label} generation: {str(e)}')
+        return
+
+    await item.asave(update_fields=['enhanced_description', 'generated_image_url', 'seed'])
+    if item.generated_image_url:
+        await _build_thumbnails(item.generated_image_url)
+        messages.success(request, f'{label.title()} generated successfully!')
+    else:
+        messages.error(request, f'Image generation failed. The {label} was saved but no image was generated.')
+
+@async_login_required
+@with_request_budget('backgrounds')
+async def backgrounds(request):
+    """Background management view - generates inline on the event loop"""
+    if request.method == 'POST':
+        form = BackgroundForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            variants = form.cleaned_data['variants']
+            rejection = await _admit(request, variants)
+            if rejection:
+                return await sync_to_async(_render_library)(request, 'backgrounds', form, rejection)
+
+            background = form.save(commit=False)
+            background.created_by = request.user
+            await background.asave()
+            if variants > 1:
+                return await _queue_variants(request, background, variants, 'background')
+            await _generate_library_image(request, background, 'background')
+            return redirect('backgrounds')
+    else:
+        form = BackgroundForm()
+
+    return await sync_to_async(_render_library)(request, 'backgrounds', form)
+
+@async_login_required
+@with_request_budget('characters')
+async def characters(request):
+    """Character management view - generates inline on the event loop"""
+    if request.method == 'POST':
+        form = CharacterForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            variants = form.cleaned_data['variants']
+            rejection = await _admit(request, variants)
+            if rejection:
+                return await sync_to_async(_render_library)(request, 'characters', form, rejection)
+
+            character = form.save(commit=False)
+            character.created_by = request.user
+            await character.asave()
+            if variants > 1:
+                return await _queue_variants(request, character, variants, 'character')
+            await _generate_library_image(request, character, 'character')
+            return redirect('characters')
+    else:
+        form = CharacterForm()
+
+    return await sync_to_async(_render_library)(request, 'characters', form)
+
+@async_login_required
+@with_request_budget('create_scene')
+async def create_scene(request):
+    """Scene creation view - composites or repaints inline on the event loop"""
+    if request.method == 'POST':
+        form = SceneForm(request.user, request.POST)
+        if await sync_to_async(form.is_valid)():
+            variants = form.cleaned_data['variants']
+            rejection = await _admit(request, variants)
+            if rejection:
+                return await sync_to_async(_too_many_requests)(
+                    request, rejection, 'composer/create_scene.html', {'form': form}
+                )
+
+            scene = form.save(commit=False)
+            scene.created_by = request.user
+            if variants > 1:
+                await scene.asave()
+                return await _queue_variants(request, scene, variants, 'scene')
+
+            # The form has already loaded the chosen background and character
+            image_url = None
+            if scene.render_mode == Scene.RENDER_COMPOSITE:
+                image_url = await SceneCompositor.acompose(
+                    scene.background.image_url,
+                    scene.character.image_url,
+                    scene.character_position
+                )
+            if not image_url:
+                scene_prompt = await AIService.instance().agenerate_scene_prompt(
+                    scene.background.prompt_description,
+                    scene.character.prompt_description,
+                    scene.character_position,
+                    scene.action_description
+                )
+                try:
+                    image_url, scene.seed = await ImageGenerationService.agenerate_seeded('scene', scene_prompt)
+                except admission.AdmissionRejected:
+                    await scene.asave()
+                    await sync_to_async(GenerationJobService.enqueue)(scene, request.user)
+                    messages.success(request, 'Scene queued! The image will appear below once it has been generated.')
+                    return redirect('scene_result', scene_id=scene.id)
+
+            if image_url:
+                scene.generated_image_url = image_url
+                await scene.asave()
+                await _build_thumbnails(image_url)
+                messages.success(request, 'Scene created successfully!')
+                return redirect('scene_result', scene_id=scene.id)
+            messages.error(request, 'Failed to generate scene image. Please try again.')
+    else:
+        form = SceneForm(request.user)
+
+    return await sync_to_async(render)(request, 'composer/create_scene.html', {'form': form})
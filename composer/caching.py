@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import storage
+from .models import CachedImage, CachedPrompt
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    """Collapse case and whitespace so trivially different prompts share a key"""
+    return re.sub(r'\s+', ' ', prompt).strip().lower()
+
+
+class ImageCache:
+    """Content-addressed store of provider images keyed by request parameters"""
+
+    @staticmethod
+    def make_key(prompt, width, height, model, seed):
+        raw = '\x1f'.join([normalize_prompt(prompt), str(width), str(height), model or '', str(seed)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def default_seed(prompt):
+        """Stable seed for a prompt, so repeat requests are cacheable"""
+        digest = hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) % 10000 + 1
+
+    @staticmethod
+    def get(key):
+        """Return the cached image URL for key, or None on a miss"""
+        entry = CachedImage.objects.filter(key=key).first()
+        if entry is None:
+            return None
+
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, entry.path)):
+            # File was removed behind our back; forget the entry
+            entry.delete()
+            return None
+
+        CachedImage.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        return entry.image_url
+
+    @staticmethod
+    def put(key, relative_path, image_url):
+        """Remember image_url under key. Best effort: the image is already
+        published, so a failed write only costs a later cache hit."""
+        try:
+            size = os.path.getsize(os.path.join(settings.MEDIA_ROOT, relative_path))
+            CachedImage.objects.update_or_create(
+                key=key,
+                defaults={
+                    'image_url': image_url,
+                    'path': relative_path,
+                    'size_bytes': size,
+                    'last_used_at': timezone.now(),
+                },
+            )
+        except (DatabaseError, OSError) as e:
+            logger.warning("Could not cache %s: %s", relative_path, e)
+
+    @staticmethod
+    async def aget(key):
+        """get() through the async ORM, for async views"""
+        entry = await CachedImage.objects.filter(key=key).afirst()
+        if entry is None:
+            return None
+
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, entry.path)):
+            await entry.adelete()
+            return None
+
+        await CachedImage.objects.filter(pk=entry.pk).aupdate(hits=F('hits') + 1, last_used_at=timezone.now())
+        return entry.image_url
+
+    @staticmethod
+    async def aput(key, relative_path, image_url):
+        """put() through the async ORM, equally best effort"""
+        try:
+            size = os.path.getsize(os.path.join(settings.MEDIA_ROOT, relative_path))
+            await CachedImage.objects.aupdate_or_create(
+                key=key,
+                defaults={
+                    'image_url': image_url,
+                    'path': relative_path,
+                    'size_bytes': size,
+                    'last_used_at': timezone.now(),
+                },
+            )
+        except (DatabaseError, OSError) as e:
+            logger.warning("Could not cache %s: %s", relative_path, e)
+
+    @staticmethod
+    def evict(max_age=None, max_bytes=None, dry_run=False):
+        """Drop entries unused for max_age seconds, then least recently used ones
+        until the cache fits in max_bytes. Files still shown by a Background,
+        Character or Scene are kept on disk; only their cache entry goes."""
+        max_age = settings.IMAGE_CACHE_MAX_AGE if max_age is None else max_age
+        max_bytes = settings.IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+        victims = []
+        if max_age:
+            cutoff = timezone.now() - timedelta(seconds=max_age)
+            victims.extend(CachedImage.objects.filter(last_used_at__lt=cutoff))
+
+        if max_bytes:
+            victim_ids = [entry.pk for entry in victims]
+            remaining = CachedImage.objects.exclude(pk__in=victim_ids)
+            total = remaining.aggregate(total=Sum('size_bytes'))['total'] or 0
+            for entry in remaining.order_by('last_used_at'):
+                if total <= max_bytes:
+                    break
+                victims.append(entry)
+                total -= entry.size_bytes
+
+        freed = 0
+        for entry in victims:
+            freed += entry.size_bytes
+            if dry_run:
+                continue
+            entry.delete()
+            storage.release(entry.image_url)
+
+        logger.info("Image cache eviction: %d entries, %d bytes%s", len(victims), freed, ' (dry run)' if dry_run else '')
+        return len(victims), freed
+
+
+class PromptCache:
+    """Two-tier memo of LLM responses: a per-process LRU in front of CachedPrompt rows"""
+
+    _lock = threading.Lock()
+    _memory = OrderedDict()  # key -> (expires_at, response)
+    stats = {'memory_hits': 0, 'store_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def make_key(template, **inputs):
+        raw = json.dumps({'template': template, 'inputs': inputs}, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _count(cls, stat):
+        with cls._lock:
+            cls.stats[stat] += 1
+
+    @classmethod
+    def _remember(cls, key, expires_at, response):
+        with cls._lock:
+            cls._memory[key] = (expires_at, response)
+            cls._memory.move_to_end(key)
+            while len(cls._memory) > settings.PROMPT_CACHE_MEMORY_SIZE:
+                cls._memory.popitem(last=False)
+
+    @classmethod
+    def get(cls, key):
+        """Return the cached response for key, or None on a miss"""
+        now = timezone.now()
+        with cls._lock:
+            cached = cls._memory.get(key)
+            if cached and cached[0] > now:
+                cls._memory.move_to_end(key)
+                cls.stats['memory_hits'] += 1
+                return cached[1]
+            cls._memory.pop(key, None)
+
+        entry = CachedPrompt.objects.filter(key=key, expires_at__gt=now).first()
+        if entry is None:
+            cls._count('misses')
+            return None
+
+        CachedPrompt.objects.filter(pk=entry.pk).update(hits=F('hits') + 1)
+        cls._remember(key, entry.expires_at, entry.response)
+        cls._count('store_hits')
+        return entry.response
+
+    @classmethod
+    def put(cls, key, response):
+        """Best effort like ImageCache.put: without the shared row the response
+        is still remembered in this process"""
+        expires_at = timezone.now() + timedelta(seconds=settings.PROMPT_CACHE_TTL)
+        try:
+            CachedPrompt.objects.update_or_create(
+                key=key, defaults={'response': response, 'expires_at': expires_at}
+            )
+        except DatabaseError as e:
+            logger.warning("Could not store cached prompt %s: %s", key[:16], e)
+        cls._remember(key, expires_at, response)
+
+    @classmethod
+    def clear_expired(cls):
+        return CachedPrompt.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+    @classmethod
+    def hit_ratio(cls):
+        with cls._lock:
+            hits = cls.stats['memory_hits'] + cls.stats['store_hits']
+            total = hits + cls.stats['misses']
+        return hits / total if total else 0.0
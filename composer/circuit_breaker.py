@@ -0,0 +1,120 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import registry
+from .models import CircuitBreakerState
+
+
+logger = logging.getLogger(__name__)
+
+STATE_VALUES = {
+    CircuitBreakerState.STATE_CLOSED: 0,
+    CircuitBreakerState.STATE_HALF_OPEN: 1,
+    CircuitBreakerState.STATE_OPEN: 2,
+}
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker whose state lives in the database, so one
+    process noticing an outage short-circuits every other process too.
+
+    closed:    calls go through; trips open when the failure rate over the
+               rolling window reaches the threshold
+    open:      calls are refused until the cooldown has passed
+    half_open: a single probe call is let through; success closes the
+               breaker, failure opens it again
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.window = settings.CIRCUIT_BREAKER_WINDOW
+        self.min_calls = settings.CIRCUIT_BREAKER_MIN_CALLS
+        self.failure_rate = settings.CIRCUIT_BREAKER_FAILURE_RATE
+        self.cooldown = settings.CIRCUIT_BREAKER_COOLDOWN
+
+    def _load(self):
+        state, _ = CircuitBreakerState.objects.get_or_create(
+            name=self.name, defaults={'window_started_at': timezone.now()}
+        )
+        return state
+
+    def _transition(self, from_state, to_state, **fields):
+        """Move between states; only the process whose update lands records it"""
+        changed = CircuitBreakerState.objects.filter(name=self.name, state=from_state).update(
+            state=to_state, **fields
+        )
+        if changed:
+            logger.warning("Circuit breaker %s: %s -> %s", self.name, from_state, to_state)
+            registry.inc('circuit_breaker_transitions_total', breaker=self.name, from_state=from_state, to_state=to_state)
+            registry.set_gauge('circuit_breaker_state', STATE_VALUES[to_state], breaker=self.name)
+        return bool(changed)
+
+    def allow_request(self):
+        state = self._load()
+        now = timezone.now()
+        registry.set_gauge('circuit_breaker_state', STATE_VALUES[state.state], breaker=self.name)
+
+        if state.state == CircuitBreakerState.STATE_CLOSED:
+            return True
+
+        if state.state == CircuitBreakerState.STATE_OPEN:
+            if state.opened_at and now - state.opened_at >= timedelta(seconds=self.cooldown):
+                # Whoever wins the transition sends the probe
+                return self._transition(
+                    CircuitBreakerState.STATE_OPEN, CircuitBreakerState.STATE_HALF_OPEN, probe_started_at=now
+                )
+            registry.inc('circuit_breaker_rejections_total', breaker=self.name)
+            return False
+
+        # Half-open: refuse while a probe is in flight, unless it has gone quiet
+        stale = now - timedelta(seconds=self.cooldown)
+        claimed = CircuitBreakerState.objects.filter(
+            name=self.name, state=CircuitBreakerState.STATE_HALF_OPEN, probe_started_at__lt=stale
+        ).update(probe_started_at=now)
+        if not claimed:
+            registry.inc('circuit_breaker_rejections_total', breaker=self.name)
+        return bool(claimed)
+
+    def _roll_window(self, state, now):
+        if now - state.window_started_at >= timedelta(seconds=self.window):
+            CircuitBreakerState.objects.filter(pk=state.pk, window_started_at=state.window_started_at).update(
+                failure_count=0, success_count=0, window_started_at=now
+            )
+
+    def record_success(self):
+        state = self._load()
+        now = timezone.now()
+        if state.state == CircuitBreakerState.STATE_HALF_OPEN:
+            self._transition(
+                CircuitBreakerState.STATE_HALF_OPEN, CircuitBreakerState.STATE_CLOSED,
+                failure_count=0, success_count=0, window_started_at=now, opened_at=None, probe_started_at=None,
+            )
+            return
+
+        self._roll_window(state, now)
+        CircuitBreakerState.objects.filter(pk=state.pk).update(success_count=F('success_count') + 1)
+
+    def record_failure(self):
+        state = self._load()
+        now = timezone.now()
+        if state.state == CircuitBreakerState.STATE_HALF_OPEN:
+            self._transition(
+                CircuitBreakerState.STATE_HALF_OPEN, CircuitBreakerState.STATE_OPEN,
+                opened_at=now, probe_started_at=None,
+            )
+            return
+
+        self._roll_window(state, now)
+        CircuitBreakerState.objects.filter(pk=state.pk).update(failure_count=F('failure_count') + 1)
+        state.refresh_from_db()
+
+        calls = state.failure_count + state.success_count
+        if (state.state == CircuitBreakerState.STATE_CLOSED and calls >= self.min_calls
+                and state.failure_count / calls >= self.failure_rate):
+            self._transition(
+                CircuitBreakerState.STATE_CLOSED, CircuitBreakerState.STATE_OPEN, opened_at=now
+            )
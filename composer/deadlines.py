@@ -0,0 +1,61 @@
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+
+# Monotonic time by which the current request's generation must be done, or
+# None when unbounded (workers, bulk creation). Worker threads and
+# sync_to_async calls started with a copy of the context see it too.
+_deadline = contextvars.ContextVar('generation_deadline', default=None)
+
+
+@contextmanager
+def budget(seconds):
+    """Bound the generation work in this block to seconds; a nested budget can
+    only tighten the one around it. None leaves the current bound as it is."""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(reserve=0):
+    """Seconds left in the budget after holding back reserve (never negative),
+    or None when there is no budget"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic() - reserve, 0)
+
+
+def clamp(seconds, reserve=0):
+    """A stage timeout: seconds, cut down to what the budget has left after reserve"""
+    left = remaining(reserve)
+    return seconds if left is None else min(seconds, left)
+
+
+def with_request_budget(name):
+    """Run a view under its REQUEST_DEADLINES entry, for views that generate inline"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                with budget(settings.REQUEST_DEADLINES.get(name)):
+                    return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                with budget(settings.REQUEST_DEADLINES.get(name)):
+                    return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
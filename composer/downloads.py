@@ -0,0 +1,139 @@
+import logging
+import os
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from PIL import Image
+
+from . import async_http_client, http_client
+
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """The provider response could not be turned into a valid image file"""
+
+
+def _fsync_directory(directory):
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _verify_image(path, expected_size):
+    try:
+        with Image.open(path) as img:
+            size = img.size
+            # A full decode; verify() alone accepts truncated JPEGs
+            img.load()
+    except Exception as e:
+        raise DownloadError(f"not a decodable image: {e}")
+
+    if expected_size and settings.DOWNLOAD_VERIFY_DIMENSIONS and size != tuple(expected_size):
+        raise DownloadError(f"expected {expected_size[0]}x{expected_size[1]}, got {size[0]}x{size[1]}")
+
+
+def _sync_to_disk(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def download_image(url, directory, expected_size=None, timeout=None):
+    """Stream url into a hidden temp file in directory and validate it.
+
+    The file is size-capped, decoded to check it is really an image of
+    expected_size, and fsynced. Returns the temp path; hand it to publish()
+    to make it visible. Raises DownloadError and leaves nothing behind on any
+    failure.
+    """
+    max_bytes = settings.DOWNLOAD_MAX_BYTES
+    os.makedirs(directory, exist_ok=True)
+
+    with http_client.get(url, timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            raise DownloadError(f"status {response.status_code}")
+
+        declared = int(response.headers.get('Content-Length') or 0)
+        if declared > max_bytes:
+            raise DownloadError(f"declared size {declared} exceeds {max_bytes} bytes")
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.download-', suffix='.part')
+        try:
+            received = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=settings.DOWNLOAD_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise DownloadError(f"body exceeds {max_bytes} bytes")
+                    f.write(chunk)
+                _sync_to_disk(f)
+
+            if received < settings.DOWNLOAD_MIN_BYTES:
+                raise DownloadError(f"body too small ({received} bytes)")
+            _verify_image(temp_path, expected_size)
+        except BaseException:
+            discard(temp_path)
+            raise
+
+    return temp_path
+
+
+async def adownload_image(url, directory, expected_size=None, timeout=None):
+    """download_image() for async views: the body streams over the shared
+    httpx client, so a slow provider holds no thread, while fsync and the
+    image decode run on a worker thread."""
+    max_bytes = settings.DOWNLOAD_MAX_BYTES
+    os.makedirs(directory, exist_ok=True)
+
+    async with async_http_client.stream(url, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise DownloadError(f"status {response.status_code}")
+
+        declared = int(response.headers.get('Content-Length') or 0)
+        if declared > max_bytes:
+            raise DownloadError(f"declared size {declared} exceeds {max_bytes} bytes")
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.download-', suffix='.part')
+        try:
+            received = 0
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in response.aiter_bytes(chunk_size=settings.DOWNLOAD_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise DownloadError(f"body exceeds {max_bytes} bytes")
+                    f.write(chunk)
+                await sync_to_async(_sync_to_disk, thread_sensitive=False)(f)
+
+            if received < settings.DOWNLOAD_MIN_BYTES:
+                raise DownloadError(f"body too small ({received} bytes)")
+            await sync_to_async(_verify_image, thread_sensitive=False)(temp_path, expected_size)
+        except BaseException:
+            # Includes cancellation, e.g. a losing model in a race
+            discard(temp_path)
+            raise
+
+    return temp_path
+
+
+def publish(temp_path, final_path):
+    """Atomically move a validated download to its final name"""
+    os.chmod(temp_path, 0o644)  # mkstemp files are owner-only; media is served by others
+    os.replace(temp_path, final_path)
+    _fsync_directory(os.path.dirname(final_path))
+
+
+def discard(temp_path):
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from .models import Background, Character, Scene
@@ -32,7 +33,23 @@ class CustomAuthenticationForm(AuthenticationForm):
         widget=forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Password'})
     )
 
+def variants_field():
+    """How many seeds of the image to generate at once, for the user to pick one"""
+    return forms.TypedChoiceField(
+        label='Variants',
+        choices=[(1, 'One image')] + [
+            (count, f'{count} variants to choose from') for count in range(2, settings.GENERATION_MAX_VARIANTS + 1)
+        ],
+        coerce=int,
+        initial=1,
+        required=False,
+        empty_value=1,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
 class BackgroundForm(forms.ModelForm):
+    variants = variants_field()
+
     class Meta:
         model = Background
         fields = ['name', 'description']  # Removed 'image' field
@@ -46,6 +63,8 @@ class BackgroundForm(forms.ModelForm):
         }
 
 class CharacterForm(forms.ModelForm):
+    variants = variants_field()
+
     class Meta:
         model = Character
         fields = ['name', 'description']  # Removed 'image' field
@@ -59,14 +78,17 @@ class CharacterForm(forms.ModelForm):
         }
 
 class SceneForm(forms.ModelForm):
+    variants = variants_field()
+
     class Meta:
         model = Scene
-        fields = ['title', 'background', 'character', 'character_position', 'action_description']
+        fields = ['title', 'background', 'character', 'character_position', 'action_description', 'render_mode']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Scene Title'}),
             'background': forms.Select(attrs={'class': 'form-select'}),
             'character': forms.Select(attrs={'class': 'form-select'}),
             'character_position': forms.Select(attrs={'class': 'form-select'}),
+            'render_mode': forms.Select(attrs={'class': 'form-select'}),
             'action_description': forms.Textarea(attrs={
                 'class': 'form-control', 
                 'rows': 4,
@@ -76,5 +98,13 @@ class SceneForm(forms.ModelForm):
     
     def __init__(self, user, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['background'].queryset = Background.objects.filter(created_by=user)
-        self.fields['character'].queryset = Character.objects.filter(created_by=user)
+        # Newest first, matching the library pages (and their composite index)
+        self.fields['background'].queryset = Background.objects.filter(created_by=user).order_by('-created_at', '-id')
+        self.fields['character'].queryset = Character.objects.filter(created_by=user).order_by('-created_at', '-id')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Compositing has no seed to vary
+        if cleaned_data.get('render_mode') == Scene.RENDER_COMPOSITE:
+            cleaned_data['variants'] = 1
+        return cleaned_data
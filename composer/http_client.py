@@ -0,0 +1,118 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+# Monotonic deadline of the get() running in this context, from its timeout
+_call_deadline = contextvars.ContextVar('http_call_deadline', default=None)
+
+
+def retry_sleep_cap(deadline=None):
+    """Longest sleep allowed before a retry: HTTP_RETRY_MAX_SLEEP, or less when
+    deadline (a time.monotonic() value) is nearer; 0 once it has passed"""
+    cap = settings.HTTP_RETRY_MAX_SLEEP
+    if deadline is not None:
+        cap = min(cap, deadline - time.monotonic())
+    return max(cap, 0)
+
+
+def _build_retry():
+    from urllib3.util.retry import Retry
+
+    class CappedRetry(Retry):
+        """Retry whose Retry-After and backoff sleeps never run past the
+        call's timeout, and which hands back the last response once it is spent"""
+
+        def is_retry(self, method, status_code, has_retry_after=False):
+            deadline = _call_deadline.get()
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            return super().is_retry(method, status_code, has_retry_after)
+
+        def get_retry_after(self, response):
+            retry_after = super().get_retry_after(response)
+            return None if retry_after is None else min(retry_after, retry_sleep_cap(_call_deadline.get()))
+
+        def get_backoff_time(self):
+            return min(super().get_backoff_time(), retry_sleep_cap(_call_deadline.get()))
+
+    return CappedRetry(
+        total=settings.HTTP_RETRY_TOTAL,
+        connect=settings.HTTP_RETRY_TOTAL,
+        read=0,  # A slow image is retried by the caller, not silently re-requested
+        status=settings.HTTP_RETRY_TOTAL,
+        status_forcelist=settings.HTTP_RETRY_STATUSES,
+        allowed_methods=['GET', 'HEAD'],
+        backoff_factor=settings.HTTP_RETRY_BACKOFF,
+        backoff_jitter=settings.HTTP_RETRY_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    # requests is imported on first use to keep it off the startup path
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    retry = _build_retry()
+
+    default_adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount('http://', default_adapter)
+    session.mount('https://', default_adapter)
+
+    # Busy provider hosts get their own, larger pool
+    for host, pool_size in settings.HTTP_HOST_POOL_SIZES.items():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session.mount(f'https://{host}/', adapter)
+        session.mount(f'http://{host}/', adapter)
+    return session
+
+
+def get_session():
+    """Process-wide keep-alive session, rebuilt after a fork so children
+    never share sockets with their parent"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+                logger.debug("Created pooled HTTP session for pid %s", pid)
+    return _session
+
+
+def timeout_for(url, limit=None):
+    """(connect, read) timeout for the URL's host, optionally capped by limit seconds"""
+    host = urllib.parse.urlsplit(url).hostname or ''
+    connect, read = settings.HTTP_HOST_TIMEOUTS.get(host, settings.HTTP_DEFAULT_TIMEOUT)
+    if limit is not None:
+        connect, read = min(connect, limit), min(read, limit)
+    return connect, read
+
+
+def get(url, timeout=None, **kwargs):
+    """GET through the pooled session; timeout caps the per-host timeouts and
+    the sleeps between retries"""
+    token = _call_deadline.set(None if timeout is None else time.monotonic() + timeout)
+    try:
+        return get_session().get(url, timeout=timeout_for(url, timeout), **kwargs)
+    finally:
+        _call_deadline.reset(token)
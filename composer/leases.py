@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import GenerationLease
+
+
+# Named claims held by one caller across every process, via GenerationLease
+# rows. A lease left behind by a crashed holder lapses at its expiry.
+
+
+def acquire(key, owner, duration):
+    """Claim key for duration seconds; False while someone else holds it"""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=duration)
+    try:
+        with transaction.atomic():
+            GenerationLease.objects.create(key=key, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        # Take over a lease its holder abandoned
+        return bool(GenerationLease.objects.filter(key=key, expires_at__lte=now).update(
+            owner=owner, expires_at=expires_at
+        ))
+
+
+def acquire_any(keys, owner, duration):
+    """Claim the first free key of keys; returns it, or None when all are held"""
+    held = set(GenerationLease.objects.filter(key__in=keys, expires_at__gt=timezone.now())
+               .values_list('key', flat=True))
+    for key in keys:
+        if key not in held and acquire(key, owner, duration):
+            return key
+    return None
+
+
+def release(key, owner):
+    GenerationLease.objects.filter(key=key, owner=owner).delete()
+
+
+def state(key):
+    """'held', 'expired' or 'released'"""
+    expires_at = GenerationLease.objects.filter(key=key).values_list('expires_at', flat=True).first()
+    if expires_at is None:
+        return 'released'
+    return 'held' if expires_at > timezone.now() else 'expired'
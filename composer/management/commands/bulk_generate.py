@@ -0,0 +1,47 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from composer.services import BulkGenerationService
+
+
+class Command(BaseCommand):
+    help = "Create backgrounds or characters in bulk from a JSON or CSV file of name/description pairs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(BulkGenerationService.KINDS))
+        parser.add_argument('path', help='JSON list of {"name", "description"} objects, or CSV with a header row')
+        parser.add_argument('--user', required=True, help='Username that will own the new rows')
+        parser.add_argument('--workers', type=int, default=settings.BULK_GENERATION_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=settings.BULK_GENERATION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+
+        fmt = 'csv' if os.path.splitext(options['path'])[1].lower() == '.csv' else 'json'
+        with open(options['path'], encoding='utf-8') as f:
+            data = f.read()
+        try:
+            items = BulkGenerationService.parse_items(data, fmt)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Generating {len(items)} {options['kind']}(s) with {options['workers']} workers")
+        for update in BulkGenerationService.run(
+            options['kind'], items, user, workers=options['workers'], batch_size=options['batch_size']
+        ):
+            if update.get('summary'):
+                self.stdout.write(self.style.SUCCESS(
+                    f"Created {update['created']} {options['kind']}(s), {update['failed']} without an image"
+                ))
+            else:
+                style = self.style.SUCCESS if update['status'] == 'succeeded' else self.style.ERROR
+                self.stdout.write(style(
+                    f"[{update['done']}/{update['total']}] {update['name']}: {update['image_url'] or update['error'] or 'no image'}"
+                ))
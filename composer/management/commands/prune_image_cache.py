@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from composer.caching import ImageCache, PromptCache
+
+
+class Command(BaseCommand):
+    help = "Evict old or excess entries from the generated image cache and expired prompts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.IMAGE_CACHE_MAX_AGE,
+            help='Evict entries unused for this many seconds (0 disables)',
+        )
+        parser.add_argument(
+            '--max-bytes', type=int, default=settings.IMAGE_CACHE_MAX_BYTES,
+            help='Evict least recently used entries until the cache fits (0 disables)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be evicted without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        count, freed = ImageCache.evict(
+            max_age=options['max_age'],
+            max_bytes=options['max_bytes'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would evict' if options['dry_run'] else 'Evicted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} cached image(s), {freed / 1024 ** 2:.1f} MB"
+        ))
+
+        if not options['dry_run']:
+            expired = PromptCache.clear_expired()
+            self.stdout.write(self.style.SUCCESS(f"Removed {expired} expired prompt(s)"))
@@ -0,0 +1,77 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from composer import metrics, rendering
+from composer.models import GenerationJob
+from composer.services import GenerationJobService
+
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Run queued image generation jobs outside the web process"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.GENERATION_WORKER_POLL_INTERVAL,
+            help='Seconds to sleep when the queue is empty',
+        )
+        parser.add_argument(
+            '--max-jobs', type=int, default=0,
+            help='Exit after running this many jobs (0 means no limit)',
+        )
+        parser.add_argument(
+            '--metrics-port', type=int, default=0,
+            help='Serve this worker\'s metrics for Prometheus on this port (0 means off)',
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        if options['metrics_port']:
+            metrics.serve(options['metrics_port'])
+            self.stdout.write(f"Serving metrics on port {options['metrics_port']}")
+        rendering.start_warmup()
+        self.stdout.write(f"Generation worker started (poll every {options['poll_interval']}s)")
+
+        while True:
+            GenerationJobService.requeue_stale(settings.GENERATION_JOB_STALE_AFTER)
+            job = GenerationJobService.claim_next()
+
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            try:
+                job = GenerationJobService.run(job)
+            except Exception as e:
+                # One bad job must not take the worker down with it
+                logger.exception("%s crashed the worker loop", job)
+                job.status, job.error = GenerationJob.STATUS_FAILED, str(e)
+                GenerationJob.objects.filter(pk=job.pk).update(
+                    status=job.status, error=job.error, finished_at=timezone.now()
+                )
+            if job.status == GenerationJob.STATUS_PENDING:
+                # Deferred by admission control or due a retry: let the provider breathe first
+                self.stdout.write(f"{job} returned to the queue")
+                time.sleep(options['poll_interval'])
+                continue
+            processed += 1
+            self.stdout.write(
+                f"{job} finished in {time.monotonic() - started:.1f}s"
+            )
+
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)"))
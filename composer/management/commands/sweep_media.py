@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from composer import storage
+
+
+class Command(BaseCommand):
+    help = "Delete generated images and thumbnails that no background, character, scene or cache entry references"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List what would be deleted without deleting anything',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_SWEEP_MIN_AGE,
+            help='Skip files modified in the last N seconds (they may still be in use)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Files deleted between pauses',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=1.0,
+            help='Seconds to sleep after each batch, to limit I/O load',
+        )
+
+    def handle(self, *args, **options):
+        count = freed = 0
+        for relative, size in storage.find_orphans(options['min_age']):
+            if options['dry_run']:
+                self.stdout.write(f"would delete {relative}")
+                freed += size
+            else:
+                freed += storage.remove(relative)
+            count += 1
+
+            if not options['dry_run'] and count % options['batch_size'] == 0:
+                self.stdout.write(f"{count} files deleted so far, pausing")
+                time.sleep(options['pause'])
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} file(s), {freed / 1024 ** 2:.1f} MB"))
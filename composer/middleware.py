@@ -0,0 +1,46 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import timing
+
+
+class ServerTimingMiddleware:
+    """Collect the generation stages run while serving a request and, when
+    SERVER_TIMING_HEADER is on, report them in a Server-Timing header so
+    browser dev tools show where a slow request spent its time"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = timing.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            stages = timing.finish_request(token)
+        return self._annotate(response, stages, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = timing.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stages = timing.finish_request(token)
+        return self._annotate(response, stages, started)
+
+    @staticmethod
+    def _annotate(response, stages, started):
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timing.server_timing(stages, total=time.perf_counter() - started)
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('composer', '0003_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('image_url', models.CharField(max_length=500)),
+                ('path', models.CharField(max_length=500)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('composer', '0005_cachedprompt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scene',
+            name='render_mode',
+            field=models.CharField(choices=[('composite', 'Compose from my background and character'), ('repaint', 'AI repaint (slower)')], default='composite', max_length=10),
+        ),
+    ]
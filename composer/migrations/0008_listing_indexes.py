@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("composer", "0007_circuitbreakerstate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="background",
+            index=models.Index(
+                fields=["created_by", "created_at", "id"],
+                name="background_owner_recent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="character",
+            index=models.Index(
+                fields=["created_by", "created_at", "id"],
+                name="character_owner_recent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="generationjob",
+            index=models.Index(
+                fields=["status", "created_at", "id"], name="job_queue_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scene",
+            index=models.Index(
+                fields=["created_by", "created_at", "id"], name="scene_owner_recent_idx"
+            ),
+        ),
+    ]
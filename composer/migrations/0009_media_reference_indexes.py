@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("composer", "0008_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="background",
+            name="generated_image_url",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=500, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cachedimage",
+            name="image_url",
+            field=models.CharField(db_index=True, max_length=500),
+        ),
+        migrations.AlterField(
+            model_name="character",
+            name="generated_image_url",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=500, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="scene",
+            name="generated_image_url",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=500, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("composer", "0009_media_reference_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="background",
+            name="enhanced_description",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="character",
+            name="enhanced_description",
+            field=models.TextField(blank=True),
+        ),
+    ]
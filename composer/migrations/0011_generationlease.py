@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("composer", "0010_enhanced_description"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GenerationLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("owner", models.CharField(max_length=64)),
+                ("expires_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
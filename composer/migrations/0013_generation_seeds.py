@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("composer", "0012_ratelimitbucket"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="background",
+            name="seed",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="character",
+            name="seed",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="generationjob",
+            name="variants",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="scene",
+            name="seed",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -4,11 +4,19 @@ from django.contrib.auth.models import User
 class Background(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
+    enhanced_description = models.TextField(blank=True)  # Gemini's rewrite, reused by scene prompts
     image = models.ImageField(upload_to='backgrounds/', blank=True, null=True)
-    generated_image_url = models.CharField(max_length=500, blank=True, null=True)  # Changed to CharField
+    generated_image_url = models.CharField(max_length=500, blank=True, null=True, db_index=True)  # Indexed for media reference checks
+    seed = models.PositiveIntegerField(blank=True, null=True)  # Pollinations seed of the image, to reproduce it
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Per-user library listing, newest first (see composer.pagination)
+            models.Index(fields=['created_by', 'created_at', 'id'], name='background_owner_recent_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
@@ -17,15 +25,27 @@ class Background(models.Model):
         if self.image:
             return self.image.url
         return self.generated_image_url
+    
+    @property
+    def prompt_description(self):
+        return self.enhanced_description or self.description
 
 class Character(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
+    enhanced_description = models.TextField(blank=True)  # Gemini's rewrite, reused by scene prompts
     image = models.ImageField(upload_to='characters/', blank=True, null=True)
-    generated_image_url = models.CharField(max_length=500, blank=True, null=True)  # Changed to CharField
+    generated_image_url = models.CharField(max_length=500, blank=True, null=True, db_index=True)  # Indexed for media reference checks
+    seed = models.PositiveIntegerField(blank=True, null=True)  # Pollinations seed of the image, to reproduce it
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Per-user library listing, newest first (see composer.pagination)
+            models.Index(fields=['created_by', 'created_at', 'id'], name='character_owner_recent_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
@@ -34,6 +54,10 @@ class Character(models.Model):
         if self.image:
             return self.image.url
         return self.generated_image_url
+    
+    @property
+    def prompt_description(self):
+        return self.enhanced_description or self.description
 
 class Scene(models.Model):
     POSITION_CHOICES = [
@@ -42,14 +66,152 @@ class Scene(models.Model):
         ('center', 'Center'),
     ]
     
+    RENDER_COMPOSITE = 'composite'
+    RENDER_REPAINT = 'repaint'
+    RENDER_MODE_CHOICES = [
+        (RENDER_COMPOSITE, 'Compose from my background and character'),
+        (RENDER_REPAINT, 'AI repaint (slower)'),
+    ]
+    
     title = models.CharField(max_length=200)
     background = models.ForeignKey(Background, on_delete=models.CASCADE)
     character = models.ForeignKey(Character, on_delete=models.CASCADE)
     character_position = models.CharField(max_length=10, choices=POSITION_CHOICES)
     action_description = models.TextField()
-    generated_image_url = models.CharField(max_length=500, blank=True, null=True)  # Changed to CharField
+    render_mode = models.CharField(max_length=10, choices=RENDER_MODE_CHOICES, default=RENDER_COMPOSITE)
+    generated_image_url = models.CharField(max_length=500, blank=True, null=True, db_index=True)  # Indexed for media reference checks
+    seed = models.PositiveIntegerField(blank=True, null=True)  # Pollinations seed of a repainted image; composites have none
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'created_at', 'id'], name='scene_owner_recent_idx'),
+        ]
+    
     def __str__(self):
         return self.title
+
+class GenerationJob(models.Model):
+    KIND_BACKGROUND = 'background'
+    KIND_CHARACTER = 'character'
+    KIND_SCENE = 'scene'
+    KIND_CHOICES = [
+        (KIND_BACKGROUND, 'Background'),
+        (KIND_CHARACTER, 'Character'),
+        (KIND_SCENE, 'Scene'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    background = models.ForeignKey(Background, on_delete=models.CASCADE, blank=True, null=True, related_name='generation_jobs')
+    character = models.ForeignKey(Character, on_delete=models.CASCADE, blank=True, null=True, related_name='generation_jobs')
+    scene = models.ForeignKey(Scene, on_delete=models.CASCADE, blank=True, null=True, related_name='generation_jobs')
+    options = models.JSONField(default=dict, blank=True)
+    variants = models.JSONField(default=list, blank=True)  # [{'seed', 'image_url'}] generated in variants mode
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Worker queue scan: oldest pending job first
+            models.Index(fields=['status', 'created_at', 'id'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job #{self.pk} ({self.status})"
+
+    @property
+    def target(self):
+        """The Background, Character or Scene this job generates an image for"""
+        return getattr(self, self.kind)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def variant(self, seed):
+        """The variant generated with seed, or None"""
+        return next((variant for variant in self.variants if variant['seed'] == seed), None)
+
+class CachedImage(models.Model):
+    """A generated image file reusable for identical provider requests"""
+    key = models.CharField(max_length=64, unique=True)
+    image_url = models.CharField(max_length=500, db_index=True)
+    path = models.CharField(max_length=500)  # Relative to MEDIA_ROOT
+    size_bytes = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.path
+
+class CachedPrompt(models.Model):
+    """A memoized Gemini response for a prompt template and its inputs"""
+    key = models.CharField(max_length=64, unique=True)
+    response = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.key
+
+class GenerationLease(models.Model):
+    """A named claim held by one process at a time (composer.leases): an in-flight
+    provider call that identical generations wait on, or an upstream concurrency slot"""
+    key = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=64)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every process (composer.admission.TokenBucket)"""
+    key = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}"
+
+class CircuitBreakerState(models.Model):
+    """Breaker state shared by every worker process talking to a provider"""
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+    STATE_CHOICES = [
+        (STATE_CLOSED, 'Closed'),
+        (STATE_OPEN, 'Open'),
+        (STATE_HALF_OPEN, 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=STATE_CLOSED)
+    failure_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    window_started_at = models.DateTimeField()
+    opened_at = models.DateTimeField(blank=True, null=True)
+    probe_started_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.state}"
@@ -0,0 +1,52 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(obj):
+    """Opaque cursor pointing just after obj in newest-first order"""
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(created_at, pk) from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def keyset_queryset(queryset, cursor):
+    """queryset ordered newest first and filtered to rows after cursor"""
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        # The redundant created_at__lte bounds the index range itself; the OR
+        # alone leaves the database scanning every newer row and discarding it
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk), created_at__lte=created_at
+        )
+    return queryset
+
+
+def keyset_page(queryset, cursor, page_size):
+    """One page of queryset, newest first, continuing after cursor.
+
+    Seeks on (created_at, id) instead of OFFSET, so the index range starts
+    at the cursor and a deep page costs no more than the first. Returns (items, next_cursor) where
+    next_cursor is None on the last page.
+    """
+    queryset = keyset_queryset(queryset, cursor)
+
+    # One extra row tells us whether another page exists
+    items = list(queryset[:page_size + 1])
+    if len(items) > page_size:
+        items = items[:page_size]
+        return items, encode_cursor(items[-1])
+    return items, None
@@ -0,0 +1,219 @@
+import logging
+import threading
+import textwrap
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+
+logger = logging.getLogger(__name__)
+
+
+# Enhanced color schemes based on prompt: [gradient top, gradient bottom, accent]
+BACKGROUND_SCHEMES = {
+    'beach': [(135, 206, 235), (255, 218, 185), (255, 255, 255)],  # Blue, peach, white
+    'sunset': [(255, 140, 0), (255, 165, 0), (255, 255, 255)],     # Orange theme
+    'tropical': [(34, 139, 34), (255, 215, 0), (255, 255, 255)],   # Green/gold
+    'mountain': [(119, 136, 153), (176, 196, 222), (255, 255, 255)], # Gray blue
+    'forest': [(34, 139, 34), (144, 238, 144), (255, 255, 255)],   # Green theme
+    'city': [(105, 105, 105), (169, 169, 169), (255, 255, 255)],   # Gray theme
+    'sky': [(135, 206, 235), (176, 224, 230), (255, 255, 255)],    # Sky blue
+    'ocean': [(25, 25, 112), (100, 149, 237), (255, 255, 255)],    # Deep blue
+    'default': [(147, 112, 219), (221, 160, 221), (255, 255, 255)] # Purple theme
+}
+
+# Character-themed color schemes
+CHARACTER_SCHEMES = {
+    'knight': [(70, 70, 70), (150, 150, 150), (220, 220, 220)],      # Metallic gray
+    'warrior': [(139, 69, 19), (160, 82, 45), (222, 184, 135)],      # Brown/bronze
+    'wizard': [(75, 0, 130), (138, 43, 226), (221, 160, 221)],       # Purple/violet
+    'mage': [(25, 25, 112), (65, 105, 225), (173, 216, 230)],        # Blue theme
+    'archer': [(34, 139, 34), (107, 142, 35), (154, 205, 50)],       # Green theme
+    'rogue': [(47, 79, 79), (105, 105, 105), (169, 169, 169)],       # Dark gray
+    'paladin': [(255, 215, 0), (255, 255, 224), (255, 255, 255)],    # Gold/white
+    'default': [(105, 105, 105), (169, 169, 169), (211, 211, 211)]   # Gray theme
+}
+
+# Layout of the character silhouette and its caption box
+CHARACTER_HEAD_Y = 120
+CHARACTER_LEG_MARGIN = 150  # Distance from the bottom edge to the feet
+
+
+def pick_scheme(prompt, schemes):
+    """First scheme whose keyword appears in the prompt, else 'default'"""
+    prompt_lower = prompt.lower()
+    for key in schemes:
+        if key in prompt_lower:
+            return key
+    return 'default'
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    """Load a font once per process; truetype lookups hit the filesystem"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def vertical_gradient(size, top, bottom):
+    """Top-to-bottom gradient built in C: a 256-step ramp stretched to size
+    is the blend mask between two flat fills"""
+    mask = Image.linear_gradient('L').resize(size, Image.BILINEAR)
+    return Image.composite(Image.new('RGB', size, bottom), Image.new('RGB', size, top), mask)
+
+
+def frost_panel(img, box, opacity):
+    """Blend a white panel over box only, instead of compositing a full-size overlay"""
+    region = img.crop(box)
+    img.paste(Image.blend(region, Image.new('RGB', region.size, (255, 255, 255)), opacity / 255), box)
+
+
+def centered_text(draw, text, y, font, fill, width):
+    bbox = draw.textbbox((0, 0), text, font=font)
+    draw.text(((width - (bbox[2] - bbox[0])) // 2, y), text, fill=fill, font=font)
+
+
+def render_background_base(scheme_key, width, height):
+    """Gradient and theme texture for a background/scene placeholder"""
+    colors = BACKGROUND_SCHEMES[scheme_key]
+    img = vertical_gradient((width, height), colors[0], colors[1])
+    draw = ImageDraw.Draw(img)
+
+    # Add some texture based on theme
+    if scheme_key == 'beach':
+        # Add wave-like patterns
+        for y in range(0, height, 40):
+            for x in range(0, width, 80):
+                draw.arc([x-20, y-10, x+20, y+10], 0, 180, fill=(255, 255, 255))
+    elif scheme_key == 'mountain':
+        # Add triangle shapes for mountains
+        for i in range(5):
+            x = i * (width // 5)
+            draw.polygon([(x, height), (x + width//10, height//2), (x + width//5, height)], fill=colors[2])
+
+    # Prompt panel
+    frost_panel(img, (50, 140, width - 50, height - 140), 220)
+    return img
+
+
+def render_background_text(img, prompt, prefix):
+    """Stamp the title, wrapped prompt and status lines onto a background base"""
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
+    title_font, font, small_font = load_font(36), load_font(18), load_font(14)
+
+    # Draw title with shadow
+    title = f"🎨 {prefix.title()} Preview"
+    bbox = draw.textbbox((0, 0), title, font=title_font)
+    title_x = (width - (bbox[2] - bbox[0])) // 2
+    draw.text((title_x + 2, 42), title, fill=(0, 0, 0), font=title_font)
+    draw.text((title_x, 40), title, fill=(255, 255, 255), font=title_font)
+
+    # Wrap and draw prompt text
+    lines = textwrap.fill(prompt, width=65).split('\n')
+    start_y = (height - len(lines) * 22) // 2
+    for i, line in enumerate(lines):
+        centered_text(draw, line, start_y + i * 22, font, (60, 60, 60), width)
+
+    centered_text(draw, "🔄 AI services busy - Themed placeholder generated", height - 80, small_font, (255, 255, 255), width)
+    centered_text(draw, "Try again later • AI will generate your exact image", height - 50, small_font, (255, 255, 255), width)
+    return img
+
+
+def render_character_base(scheme_key, width, height):
+    """Gradient, full body silhouette and caption box for a character placeholder"""
+    colors = CHARACTER_SCHEMES[scheme_key]
+    img = vertical_gradient((width, height), colors[0], colors[1])
+    draw = ImageDraw.Draw(img)
+    fill = colors[2]
+    center_x = width // 2
+
+    # Head (top portion)
+    head_radius = 45
+    head_y = CHARACTER_HEAD_Y
+    draw.ellipse([center_x - head_radius, head_y, center_x + head_radius, head_y + head_radius * 2], fill=fill)
+
+    # Torso (middle portion)
+    torso_width = 80
+    torso_top = head_y + head_radius * 2
+    torso_bottom = torso_top + 200
+    draw.rectangle([center_x - torso_width//2, torso_top, center_x + torso_width//2, torso_bottom], fill=fill)
+
+    # Legs (bottom portion) - FULL BODY
+    leg_width = 25
+    leg_bottom = height - CHARACTER_LEG_MARGIN
+    for leg_x in (center_x - torso_width//4, center_x + torso_width//4):
+        draw.rectangle([leg_x - leg_width//2, torso_bottom, leg_x + leg_width//2, leg_bottom], fill=fill)
+
+    # Arms
+    arm_width = 20
+    arm_y = torso_top + 30
+    draw.rectangle([center_x - torso_width//2 - arm_width, arm_y, center_x - torso_width//2, arm_y + 120], fill=fill)
+    draw.rectangle([center_x + torso_width//2, arm_y, center_x + torso_width//2 + arm_width, arm_y + 120], fill=fill)
+
+    # Title at top, with shadow
+    title_font = load_font(24)
+    title = "🛡️ Full Body Character"
+    bbox = draw.textbbox((0, 0), title, font=title_font)
+    title_x = (width - (bbox[2] - bbox[0])) // 2
+    draw.text((title_x + 1, 31), title, fill=(0, 0, 0), font=title_font)
+    draw.text((title_x, 30), title, fill=(255, 255, 255), font=title_font)
+
+    # Caption box below the feet
+    frost_panel(img, (20, leg_bottom + 20, width - 20, height - 40), 200)
+    centered_text(ImageDraw.Draw(img), "AI Character Generator Busy", height - 25, load_font(12), (255, 255, 255), width)
+    return img
+
+
+def render_character_text(img, prompt):
+    """Stamp up to three lines of the character description into the caption box"""
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
+    font = load_font(14)
+
+    wrapped_text = textwrap.fill(prompt.replace("full body portrait of ", ""), width=35)
+    y_offset = height - CHARACTER_LEG_MARGIN + 30
+    for line in wrapped_text.split('\n')[:3]:  # Limit to 3 lines
+        centered_text(draw, line, y_offset, font, (60, 60, 60), width)
+        y_offset += 16
+    return img
+
+
+@lru_cache(maxsize=settings.PLACEHOLDER_BASE_CACHE_SIZE)
+def cached_base(kind, scheme_key, width, height):
+    """Shared, read-only base layer; callers must copy() before drawing on it"""
+    render = render_background_base if kind == 'background' else render_character_base
+    return render(scheme_key, width, height)
+
+
+def warm_base_cache(background_size=(1024, 768), character_size=(768, 1024)):
+    """Pre-render the base layer of every known scheme at the default sizes"""
+    for scheme_key in BACKGROUND_SCHEMES:
+        cached_base('background', scheme_key, *background_size)
+    for scheme_key in CHARACTER_SCHEMES:
+        cached_base('character', scheme_key, *character_size)
+    logger.debug("Placeholder base layers warmed: %s", cached_base.cache_info())
+
+
+def render_background_placeholder(prompt, prefix, width=1024, height=768):
+    scheme_key = pick_scheme(prompt, BACKGROUND_SCHEMES)
+    base = cached_base('background', scheme_key, width, height).copy()
+    return render_background_text(base, prompt, prefix)
+
+
+def render_character_placeholder(prompt, width=768, height=1024):
+    scheme_key = pick_scheme(prompt, CHARACTER_SCHEMES)
+    base = cached_base('character', scheme_key, width, height).copy()
+    return render_character_text(base, prompt)
+
+
+def start_warmup():
+    """Warm the base layers on a background thread, so startup is not delayed.
+    Called by the processes that render placeholders (the WSGI/ASGI entry
+    points and the generation worker); other commands leave the cache to fill
+    lazily, if at all."""
+    if settings.PLACEHOLDER_WARM_ON_STARTUP:
+        threading.Thread(target=warm_base_cache, name='placeholder-warmup', daemon=True).start()
@@ -0,0 +1,132 @@
+import random
+import statistics
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from .metrics import registry
+
+
+class Route:
+    """One way to generate an image: a Pollinations model on the main endpoint,
+    or on another Pollinations-compatible one (e.g. benchmarks/stubs.py)"""
+
+    def __init__(self, name, model='', url=None):
+        self.name = name
+        self.model = model
+        self.url = url
+
+    @property
+    def endpoint(self):
+        return self.url or settings.POLLINATIONS_API_URL
+
+    @property
+    def cache_model(self):
+        # Routes on the main endpoint keep their bare model name in cache keys
+        # and filenames, so images cached before routing stay valid
+        return self.model if self.url is None else self.name
+
+    def __repr__(self):
+        return f"Route({self.name!r})"
+
+
+class RouteStats:
+    """Rolling window of one route's recent attempts at one image size"""
+
+    def __init__(self, window):
+        self.attempts = deque(maxlen=window)  # (seconds, succeeded)
+
+    def record(self, seconds, succeeded):
+        """succeeded is None for an attempt cancelled before it finished (an
+        async race loser): it counts towards ROUTING_MIN_SAMPLES but says
+        nothing about the route's health or speed"""
+        self.attempts.append((seconds, succeeded))
+
+    @property
+    def success_rate(self):
+        """Share of the finished attempts that delivered an image"""
+        finished = [ok for _, ok in self.attempts if ok is not None]
+        return sum(finished) / len(finished) if finished else 0.0
+
+    @property
+    def latency(self):
+        """Median seconds of the successful attempts; the provider deadline when there are none"""
+        successes = [seconds for seconds, ok in self.attempts if ok]
+        return statistics.median(successes) if successes else settings.POLLINATIONS_DEADLINE
+
+    @property
+    def score(self):
+        """Expected seconds to get an image (lower is better). A route that has
+        only ever been cancelled is taken to be as slow as the deadline, not failing."""
+        if self.attempts and all(ok is None for _, ok in self.attempts):
+            return self.latency
+        return self.latency / max(self.success_rate, 0.05)
+
+
+class ImageRouter:
+    """Ranks the IMAGE_ROUTES for each request by their recent performance at
+    that image size. Stats are kept per process: every worker learns from its
+    own traffic, which avoids a database write per provider call."""
+
+    _lock = threading.Lock()
+    _stats = {}  # (route name, 'WxH') -> RouteStats
+
+    @staticmethod
+    def routes():
+        return [Route(**route) for route in settings.IMAGE_ROUTES]
+
+    @staticmethod
+    def _size(width, height):
+        return f"{width}x{height}"
+
+    @classmethod
+    def _get_stats(cls, route, width, height):
+        key = (route.name, cls._size(width, height))
+        stats = cls._stats.get(key)
+        if stats is None:
+            stats = cls._stats[key] = RouteStats(settings.ROUTING_WINDOW)
+        return stats
+
+    @classmethod
+    def record(cls, route, width, height, seconds, succeeded):
+        with cls._lock:
+            stats = cls._get_stats(route, width, height)
+            stats.record(seconds, succeeded)
+            score, success_rate = stats.score, stats.success_rate
+        size = cls._size(width, height)
+        registry.set_gauge('image_route_score_seconds', score, route=route.name, size=size)
+        registry.set_gauge('image_route_success_rate', success_rate, route=route.name, size=size)
+
+    @classmethod
+    def rank(cls, width, height):
+        """Routes best first. Routes with fewer than ROUTING_MIN_SAMPLES
+        attempts come first so they get measured; otherwise, for a
+        ROUTING_EXPLORATION share of requests, a random other route is moved
+        to the front so a recovered route gets noticed."""
+        routes = cls.routes()
+        with cls._lock:
+            def sort_key(route):
+                stats = cls._get_stats(route, width, height)
+                return (len(stats.attempts) >= settings.ROUTING_MIN_SAMPLES, stats.score)
+            ranked = sorted(routes, key=sort_key)
+
+        if len(ranked) > 1 and random.random() < settings.ROUTING_EXPLORATION:
+            explored = ranked.pop(random.randrange(1, len(ranked)))
+            ranked.insert(0, explored)
+            registry.inc('image_route_explorations_total', route=explored.name)
+        return ranked
+
+    @classmethod
+    def snapshot(cls):
+        """{(route, size): {'attempts', 'success_rate', 'latency', 'score'}} for inspection"""
+        with cls._lock:
+            return {
+                key: {
+                    'attempts': len(stats.attempts),
+                    'success_rate': stats.success_rate,
+                    'latency': stats.latency,
+                    'score': stats.score,
+                }
+                for key, stats in cls._stats.items()
+            }
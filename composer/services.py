@@ -1,51 +1,46 @@
-import requests
-import google.generativeai as genai
 from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
 import urllib.parse
+import csv
+import functools
+import io
+import json
 import os
 import uuid
-import random
 import logging
 import hashlib
 import time
+import threading
+import asyncio
+import contextvars
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from datetime import timedelta
+
+from . import deadlines, downloads, rendering, storage, thumbnails, timing
+from .caching import ImageCache, PromptCache
+from .admission import AdmissionRejected, ConcurrencyLimiter
+from .circuit_breaker import CircuitBreaker
+from .routing import ImageRouter
+from .singleflight import SingleFlight
+from .models import Background, Character, GenerationJob
 
 
 logger = logging.getLogger(__name__)
 
 
 class AIService:
-    def __init__(self):
-        if settings.GOOGLE_API_KEY:
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-    
-    def enhance_description(self, description):
-        """Use Google Gemini to enhance image descriptions"""
-        try:
-            if not hasattr(self, 'model'):
-                return description
-            
-            prompt = f"""
+    ENHANCE_TEMPLATE = """
             Enhance this image description for AI image generation. Make it more detailed and specific for better visual results:
             
             Original: {description}
             
             Enhanced description (keep it under 80 words, detailed but concise):
             """
-            
-            response = self.model.generate_content(prompt)
-            return response.text.strip() if response.text else description
-        except Exception as e:
-            print(f"Error enhancing description: {e}")
-            return description
-    
-    def generate_scene_prompt(self, background_desc, character_desc, position, action):
-        """Create a comprehensive prompt for scene generation"""
-        try:
-            if not hasattr(self, 'model'):
-                return self._fallback_scene_prompt(background_desc, character_desc, position, action)
-            
-            prompt = f"""
+
+    SCENE_TEMPLATE = """
             Create a detailed image generation prompt that combines these elements:
             
             Background: {background_desc}
@@ -55,12 +50,162 @@ class AIService:
             
             Generate a single, detailed prompt for AI image generation (under 100 words):
             """
+
+    BATCH_ENHANCE_TEMPLATE = """
+            Enhance each of these image descriptions for AI image generation. Make each one more detailed and specific for better visual results, keeping it under 80 words.
             
-            response = self.model.generate_content(prompt)
-            return response.text.strip() if response.text else self._fallback_scene_prompt(background_desc, character_desc, position, action)
-        except Exception as e:
-            print(f"Error generating scene prompt: {e}")
-            return self._fallback_scene_prompt(background_desc, character_desc, position, action)
+            Descriptions (JSON list):
+            {descriptions}
+            
+            Respond with a JSON list of the enhanced descriptions: exactly one string per input, in the same order.
+            """
+
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """The process-wide service, created on first use and again after a
+        fork so children never share the parent's Gemini connection"""
+        pid = os.getpid()
+        if cls._instance is None or cls._instance_pid != pid:
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != pid:
+                    cls._instance = cls()
+                    cls._instance_pid = pid
+        return cls._instance
+
+    @property
+    def model(self):
+        """Gemini model, or None without an API key. The SDK takes about a
+        second to import, so it is loaded on the first call, not at startup."""
+        if self._model is None and settings.GOOGLE_API_KEY:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    options = {}
+                    if settings.GEMINI_API_ENDPOINT:
+                        options = {'transport': 'rest', 'client_options': {'api_endpoint': settings.GEMINI_API_ENDPOINT}}
+                    genai.configure(api_key=settings.GOOGLE_API_KEY, **options)
+                    self._model = genai.GenerativeModel('gemini-1.5-flash')
+        return self._model
+    
+    def _generate(self, template, step, **inputs):
+        """Run a prompt template through Gemini, memoized on the template and inputs"""
+        key = PromptCache.make_key(template, **inputs)
+        cached = PromptCache.get(key)
+        if cached is not None:
+            step.outcome = 'cached'
+            return cached
+        
+        # Within a request budget, leave enough of it for the image
+        timeout = deadlines.clamp(settings.GEMINI_TIMEOUT, reserve=settings.DEADLINE_IMAGE_RESERVE)
+        if timeout < settings.DEADLINE_MIN_STAGE:
+            step.outcome = 'over_budget'
+            return None
+        response = self.model.generate_content(template.format(**inputs), request_options={'timeout': timeout})
+        text = response.text.strip() if response.text else None
+        if text:
+            PromptCache.put(key, text)
+        return text
+    
+    def enhance_description(self, description):
+        """Use Google Gemini to enhance image descriptions"""
+        with timing.stage('enhance') as step:
+            if self.model is None:
+                step.outcome = 'skipped'
+                return description
+            try:
+                return self._generate(self.ENHANCE_TEMPLATE, step, description=description) or description
+            except Exception as e:
+                logger.warning("Enhancing description failed: %s", e)
+                step.outcome = 'error'
+                return description
+    
+    def enhance_descriptions(self, descriptions):
+        """Enhance many descriptions with one Gemini request per AI_ENHANCE_BATCH_SIZE.
+        
+        Returns a list aligned with descriptions. Cached results are not re-sent,
+        new ones are cached under the same key enhance_description() uses, and
+        anything that cannot be parsed back keeps its original text.
+        """
+        results = list(descriptions)
+        if self.model is None:
+            return results
+        
+        # Unique uncached descriptions -> every position they occupy
+        misses = {}
+        for index, description in enumerate(descriptions):
+            cached = PromptCache.get(PromptCache.make_key(self.ENHANCE_TEMPLATE, description=description))
+            if cached is not None:
+                results[index] = cached
+            else:
+                misses.setdefault(description, []).append(index)
+        
+        pending = list(misses)
+        batch_size = settings.AI_ENHANCE_BATCH_SIZE
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            with timing.stage('enhance_batch') as step:
+                try:
+                    enhanced = self._generate_batch(batch)
+                except Exception as e:
+                    logger.warning("Enhancing %d descriptions failed: %s", len(batch), e)
+                    step.outcome = 'error'
+                    continue
+            for description, text in zip(batch, enhanced):
+                PromptCache.put(PromptCache.make_key(self.ENHANCE_TEMPLATE, description=description), text)
+                for index in misses[description]:
+                    results[index] = text
+        return results
+    
+    def _generate_batch(self, descriptions):
+        """One structured request; raises ValueError unless the reply lines up with the input"""
+        response = self.model.generate_content(
+            self.BATCH_ENHANCE_TEMPLATE.format(descriptions=json.dumps(descriptions, ensure_ascii=False)),
+            generation_config={'response_mime_type': 'application/json'},
+        )
+        enhanced = json.loads(response.text)
+        if (not isinstance(enhanced, list) or len(enhanced) != len(descriptions)
+                or not all(isinstance(text, str) and text.strip() for text in enhanced)):
+            raise ValueError(f"expected a JSON list of {len(descriptions)} non-empty strings")
+        return [text.strip() for text in enhanced]
+    
+    def generate_scene_prompt(self, background_desc, character_desc, position, action):
+        """Create a comprehensive prompt for scene generation"""
+        with timing.stage('scene_prompt') as step:
+            if self.model is None:
+                step.outcome = 'skipped'
+                return self._fallback_scene_prompt(background_desc, character_desc, position, action)
+            try:
+                text = self._generate(
+                    self.SCENE_TEMPLATE,
+                    step,
+                    background_desc=background_desc,
+                    character_desc=character_desc,
+                    position=position,
+                    action=action,
+                )
+            except Exception as e:
+                logger.warning("Scene prompt generation failed: %s", e)
+                step.outcome = 'error'
+                text = None
+            return text or self._fallback_scene_prompt(background_desc, character_desc, position, action)
+    
+    async def aenhance_description(self, description):
+        """enhance_description() on a worker thread; the Gemini SDK call blocks"""
+        return await sync_to_async(self.enhance_description, thread_sensitive=False)(description)
+    
+    async def agenerate_scene_prompt(self, background_desc, character_desc, position, action):
+        return await sync_to_async(self.generate_scene_prompt, thread_sensitive=False)(
+            background_desc, character_desc, position, action
+        )
     
     def _fallback_scene_prompt(self, background_desc, character_desc, position, action):
         """Fallback scene prompt generation without AI"""
@@ -68,365 +213,431 @@ class AIService:
 
 
 class ImageGenerationService:
+    CHARACTER_PROMPT = "full body portrait of {description}, standing, vertical orientation, complete figure, detailed character art, fantasy style"
+    BACKGROUND_PROMPT = "{description} landscape environment wide view"
+    # Provider prompt per kind of image, for working out its seeds
+    PROMPTS = {
+        'background': BACKGROUND_PROMPT,
+        'character': CHARACTER_PROMPT,
+        'scene': "{description}",
+    }
+    
+    @staticmethod
+    def _simple_prompt(prompt):
+        return prompt[:150] if len(prompt) > 150 else prompt
+    
+    @staticmethod
+    def default_seed(kind, description):
+        """The seed kind's image for description is generated with unless one is
+        given. Derived from the prompt, so repeat requests hit the image cache."""
+        prompt = ImageGenerationService.PROMPTS[kind].format(description=description)
+        return ImageCache.default_seed(ImageGenerationService._simple_prompt(prompt))
+    
+    @staticmethod
+    def variant_seeds(kind, description, count):
+        """count distinct seeds for description, its default seed first. Also
+        derived from the prompt, so resubmitting it reuses the cached variants."""
+        prompt = ImageGenerationService._simple_prompt(
+            ImageGenerationService.PROMPTS[kind].format(description=description)
+        )
+        seeds = [ImageGenerationService.default_seed(kind, description)]
+        index = 1
+        while len(seeds) < count:
+            seed = ImageCache.default_seed(f"{prompt} #{index}")
+            if seed not in seeds:
+                seeds.append(seed)
+            index += 1
+        return seeds
+    
+    @staticmethod
+    def _pollinations_url(simple_prompt, route, width, height, seed):
+        encoded_prompt = urllib.parse.quote(simple_prompt)
+        
+        if route.model:
+            return f"{route.endpoint}{encoded_prompt}?model={route.model}&width={width}&height={height}&seed={seed}"
+        return f"{route.endpoint}{encoded_prompt}?width={width}&height={height}&seed={seed}"
+    
+    @staticmethod
+    def _fetch_pollinations(simple_prompt, route, width, height, seed, timeout=None):
+        """Download one route's image into a validated temp file; return its path or None"""
+        api_url = ImageGenerationService._pollinations_url(simple_prompt, route, width, height, seed)
+        started = time.monotonic()
+        temp_path = None
+        with timing.stage('pollinations', route=route.name) as step:
+            try:
+                temp_path = downloads.download_image(
+                    api_url,
+                    storage.absolute_path(storage.GENERATED_DIR),
+                    expected_size=(width, height),
+                    timeout=timeout,
+                )
+                step.size_bytes = os.path.getsize(temp_path)
+            except Exception as e:
+                logger.info("Pollinations route %s failed: %s", route.name, e)
+                step.outcome = 'error'
+        ImageRouter.record(route, width, height, time.monotonic() - started, temp_path is not None)
+        return temp_path
+    
+    @staticmethod
+    def _select_routes(width, height):
+        """Routes to try for a request, best first; a race uses only the leaders"""
+        ranked = ImageRouter.rank(width, height)
+        if settings.POLLINATIONS_RACE_MODELS:
+            return ranked[:settings.POLLINATIONS_RACE_WIDTH]
+        return ranked
+    
+    @staticmethod
+    def _fetch_serial(simple_prompt, routes, width, height, seed, deadline):
+        """Try each route in turn until one succeeds or the deadline passes"""
+        for route in routes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            logger.debug("Trying Pollinations route %s", route.name)
+            temp_path = ImageGenerationService._fetch_pollinations(
+                simple_prompt, route, width, height, seed, timeout=remaining
+            )
+            if temp_path:
+                return route, temp_path
+        return None
+    
+    @staticmethod
+    def _fetch_raced(simple_prompt, routes, width, height, seed, deadline, slot=None):
+        """Request every route at once and keep the first valid image. The
+        losers keep downloading after a winner returns; slot (a HeldSlot) is
+        held until they have all finished."""
+        logger.debug("Racing Pollinations routes: %s", ', '.join(route.name for route in routes))
+        executor = ThreadPoolExecutor(max_workers=len(routes), thread_name_prefix='pollinations')
+        futures = {
+            # Each attempt runs in a copy of the caller's context so its timing
+            # stage still reaches the request's Server-Timing header
+            executor.submit(
+                contextvars.copy_context().run,
+                ImageGenerationService._fetch_pollinations,
+                simple_prompt, route, width, height, seed,
+                max(deadline - time.monotonic(), 0.1)
+            ): route
+            for route in routes
+        }
+        winner = None
+        try:
+            for future in as_completed(futures, timeout=max(deadline - time.monotonic(), 0)):
+                temp_path = future.result()
+                if temp_path:
+                    winner = future
+                    return futures[future], temp_path
+        except FuturesTimeoutError:
+            logger.warning("Pollinations race hit its deadline")
+        finally:
+            # Losers cannot be interrupted mid-request; delete whatever they download
+            for future in futures:
+                if future is not winner:
+                    future.add_done_callback(ImageGenerationService._discard_download)
+            if slot is not None:
+                slot.hold_until(futures)
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None
     
     @staticmethod
-    def _try_pollinations_with_retry(prompt, prefix, width=1024, height=768):
-        """Try Pollinations with multiple retries and different models"""
-        models = ['', 'flux', 'turbo']  # Try different models
+    def _discard_download(future):
+        if not future.cancelled() and future.result():
+            downloads.discard(future.result())
+    
+    @staticmethod
+    def _try_pollinations_with_retry(prompt, prefix, width=1024, height=768, seed=None):
+        """Try Pollinations with multiple retries and different routes"""
+        simple_prompt = ImageGenerationService._simple_prompt(prompt)
+        if seed is None:
+            seed = ImageCache.default_seed(simple_prompt)
+        
+        # Identical requests reuse the stored file instead of hitting the network
+        lookup = functools.partial(ImageGenerationService._cached_image, simple_prompt, prefix, width, height, seed)
+        cached_url = lookup()
+        if cached_url:
+            return cached_url
+        
+        if not ImageGenerationService._budget_allows_fetch(prefix):
+            return None
+        
+        # ...and identical requests already in flight, here or in another
+        # process, share that call's file instead of starting their own
+        return SingleFlight(ImageGenerationService._flight_key(simple_prompt, width, height, seed)).run(
+            functools.partial(ImageGenerationService._generate_pollinations, simple_prompt, prefix, width, height, seed),
+            lookup,
+        )
+    
+    @staticmethod
+    def _budget_allows_fetch(prefix):
+        """False once the request budget is too short to try the provider"""
+        left = deadlines.remaining(reserve=settings.DEADLINE_PLACEHOLDER_RESERVE)
+        if left is not None and left < settings.DEADLINE_MIN_STAGE:
+            logger.warning("Request budget spent; skipping the provider for %s", prefix)
+            return False
+        return True
+    
+    @staticmethod
+    def _provider_deadline():
+        """(monotonic deadline for a provider attempt, whether the request budget set it)"""
+        allowed = deadlines.clamp(settings.POLLINATIONS_DEADLINE, reserve=settings.DEADLINE_PLACEHOLDER_RESERVE)
+        return time.monotonic() + allowed, allowed < settings.POLLINATIONS_DEADLINE
+    
+    @staticmethod
+    def _flight_key(simple_prompt, width, height, seed):
+        # Any route: the flight covers the whole race
+        return ImageCache.make_key(simple_prompt, width, height, '*', seed)
+    
+    @staticmethod
+    def _cached_image(simple_prompt, prefix, width, height, seed):
+        for route in ImageRouter.routes():
+            cached_url = ImageCache.get(ImageCache.make_key(simple_prompt, width, height, route.cache_model, seed))
+            if cached_url:
+                logger.info("Reusing cached %s image from route %s", prefix, route.name)
+                return cached_url
+        return None
+    
+    @staticmethod
+    def _generate_pollinations(simple_prompt, prefix, width, height, seed):
+        """Fetch a new image from Pollinations and cache it; returns its URL or None"""
+        routes = ImageGenerationService._select_routes(width, height)
+        
+        # During an outage skip straight to the placeholder instead of waiting out timeouts
+        breaker = CircuitBreaker('pollinations')
+        if not breaker.allow_request():
+            logger.warning("Pollinations circuit open; skipping the provider for %s", prefix)
+            return None
+        
+        # Shared cap on generations in flight; raises AdmissionRejected when saturated
+        with ConcurrencyLimiter('pollinations').slot() as slot:
+            deadline, budget_bound = ImageGenerationService._provider_deadline()
+            if settings.POLLINATIONS_RACE_MODELS:
+                result = ImageGenerationService._fetch_raced(
+                    simple_prompt, routes, width, height, seed, deadline, slot=slot
+                )
+            else:
+                result = ImageGenerationService._fetch_serial(simple_prompt, routes, width, height, seed, deadline)
+        if not result:
+            # Running out of request budget is not the provider's fault
+            if not (budget_bound and time.monotonic() >= deadline):
+                breaker.record_failure()
+            return None
+        breaker.record_success()
         
-        for model in models:
+        route, temp_path = result
+        cache_key = ImageCache.make_key(simple_prompt, width, height, route.cache_model, seed)
+        relative = ImageGenerationService._publish_download(temp_path, prefix, route.cache_model, cache_key)
+        image_url = storage.url_for(relative)
+        ImageCache.put(cache_key, relative, image_url)
+        return image_url
+    
+    @staticmethod
+    def _publish_download(temp_path, prefix, model, cache_key):
+        """Move a winning download to its sharded name; returns the relative path"""
+        filename = f"{prefix}_poll_{model or 'def'}_{cache_key[:16]}.jpg"
+        with timing.stage('file_write') as step:
+            step.size_bytes = os.path.getsize(temp_path)
+            relative = storage.allocate(filename)
+            downloads.publish(temp_path, storage.absolute_path(relative))
+        logger.info("Pollinations %s image saved: %s", prefix, filename)
+        return relative
+    
+    # Async counterparts for the ASGI views (composer.async_views). Downloads
+    # await the network instead of holding a thread; Pillow, fsync and the
+    # database-backed breaker still run on threads.
+    
+    @staticmethod
+    async def _afetch_pollinations(simple_prompt, route, width, height, seed, timeout=None):
+        api_url = ImageGenerationService._pollinations_url(simple_prompt, route, width, height, seed)
+        started = time.monotonic()
+        temp_path = None
+        with timing.stage('pollinations', route=route.name) as step:
             try:
-                simple_prompt = prompt[:150] if len(prompt) > 150 else prompt
-                encoded_prompt = urllib.parse.quote(simple_prompt)
-                
-                if model:
-                    api_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?model={model}&width={width}&height={height}&seed={random.randint(1, 10000)}"
-                else:
-                    api_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width={width}&height={height}&seed={random.randint(1, 10000)}"
-                
-                print(f"🎨 Trying Pollinations for {prefix} with model: {model or 'default'}...")
-                response = requests.get(api_url, timeout=30)
-                
-                if response.status_code == 200 and len(response.content) > 1000:
-                    filename = f"{prefix}_poll_{model or 'def'}_{uuid.uuid4().hex[:8]}.jpg"
-                    media_dir = os.path.join(settings.MEDIA_ROOT, 'generated_images')
-                    os.makedirs(media_dir, exist_ok=True)
-                    filepath = os.path.join(media_dir, filename)
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    print(f"✅ Pollinations {prefix} image saved: {filename}")
-                    return f"{settings.MEDIA_URL}generated_images/{filename}"
-                else:
-                    print(f"Pollinations model {model} failed with status: {response.status_code}")
-                    
+                temp_path = await downloads.adownload_image(
+                    api_url,
+                    storage.absolute_path(storage.GENERATED_DIR),
+                    expected_size=(width, height),
+                    timeout=timeout,
+                )
+                step.size_bytes = os.path.getsize(temp_path)
+            except asyncio.CancelledError:
+                # A race loser, cut off before it could finish: neither a success nor a failure
+                ImageRouter.record(route, width, height, time.monotonic() - started, None)
+                raise
             except Exception as e:
-                print(f"Pollinations model {model} failed: {e}")
-                continue
+                logger.info("Pollinations route %s failed: %s", route.name, e)
+                step.outcome = 'error'
+        ImageRouter.record(route, width, height, time.monotonic() - started, temp_path is not None)
+        return temp_path
+    
+    @staticmethod
+    async def _afetch_serial(simple_prompt, routes, width, height, seed, deadline):
+        for route in routes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            logger.debug("Trying Pollinations route %s", route.name)
+            temp_path = await ImageGenerationService._afetch_pollinations(
+                simple_prompt, route, width, height, seed, timeout=remaining
+            )
+            if temp_path:
+                return route, temp_path
+        return None
+    
+    @staticmethod
+    async def _afetch_raced(simple_prompt, routes, width, height, seed, deadline):
+        """Race the routes as tasks; unlike threads, the losers are cancelled outright"""
+        logger.debug("Racing Pollinations routes: %s", ', '.join(route.name for route in routes))
+        tasks = {
+            asyncio.ensure_future(ImageGenerationService._afetch_pollinations(
+                simple_prompt, route, width, height, seed,
+                max(deadline - time.monotonic(), 0.1)
+            )): route
+            for route in routes
+        }
+        pending = set(tasks)
+        winner = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Pollinations race hit its deadline")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        winner = task
+                        return tasks[task], task.result()
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()  # The download deletes its own temp file
+                elif task.result():
+                    downloads.discard(task.result())  # Finished in the same tick as the winner
+        return None
+    
+    @staticmethod
+    async def _atry_pollinations_with_retry(prompt, prefix, width=1024, height=768, seed=None):
+        """Async _try_pollinations_with_retry()"""
+        simple_prompt = ImageGenerationService._simple_prompt(prompt)
+        if seed is None:
+            seed = ImageCache.default_seed(simple_prompt)
+        
+        alookup = functools.partial(ImageGenerationService._acached_image, simple_prompt, prefix, width, height, seed)
+        cached_url = await alookup()
+        if cached_url:
+            return cached_url
         
+        if not ImageGenerationService._budget_allows_fetch(prefix):
+            return None
+        
+        return await SingleFlight(ImageGenerationService._flight_key(simple_prompt, width, height, seed)).arun(
+            functools.partial(ImageGenerationService._agenerate_pollinations, simple_prompt, prefix, width, height, seed),
+            alookup,
+        )
+    
+    @staticmethod
+    async def _acached_image(simple_prompt, prefix, width, height, seed):
+        for route in ImageRouter.routes():
+            cached_url = await ImageCache.aget(ImageCache.make_key(simple_prompt, width, height, route.cache_model, seed))
+            if cached_url:
+                logger.info("Reusing cached %s image from route %s", prefix, route.name)
+                return cached_url
         return None
     
+    @staticmethod
+    async def _agenerate_pollinations(simple_prompt, prefix, width, height, seed):
+        routes = ImageGenerationService._select_routes(width, height)
+        
+        breaker = CircuitBreaker('pollinations')
+        if not await sync_to_async(breaker.allow_request)():
+            logger.warning("Pollinations circuit open; skipping the provider for %s", prefix)
+            return None
+        
+        fetch = (
+            ImageGenerationService._afetch_raced if settings.POLLINATIONS_RACE_MODELS
+            else ImageGenerationService._afetch_serial
+        )
+        async with ConcurrencyLimiter('pollinations').aslot():
+            deadline, budget_bound = ImageGenerationService._provider_deadline()
+            result = await fetch(simple_prompt, routes, width, height, seed, deadline)
+        if not result:
+            if not (budget_bound and time.monotonic() >= deadline):
+                await sync_to_async(breaker.record_failure)()
+            return None
+        await sync_to_async(breaker.record_success)()
+        
+        route, temp_path = result
+        cache_key = ImageCache.make_key(simple_prompt, width, height, route.cache_model, seed)
+        relative = await sync_to_async(ImageGenerationService._publish_download, thread_sensitive=False)(
+            temp_path, prefix, route.cache_model, cache_key
+        )
+        image_url = storage.url_for(relative)
+        await ImageCache.aput(cache_key, relative, image_url)
+        return image_url
+    
     @staticmethod
     def _create_enhanced_placeholder(prompt, prefix, width=1024, height=768):
         """Create a beautiful enhanced placeholder"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            import textwrap
-            
-            # Enhanced color schemes based on prompt
-            color_schemes = {
-                'beach': [(135, 206, 235), (255, 218, 185), (255, 255, 255)],  # Blue, peach, white
-                'sunset': [(255, 140, 0), (255, 165, 0), (255, 255, 255)],     # Orange theme
-                'tropical': [(34, 139, 34), (255, 215, 0), (255, 255, 255)],   # Green/gold
-                'mountain': [(119, 136, 153), (176, 196, 222), (255, 255, 255)], # Gray blue
-                'forest': [(34, 139, 34), (144, 238, 144), (255, 255, 255)],   # Green theme
-                'city': [(105, 105, 105), (169, 169, 169), (255, 255, 255)],   # Gray theme
-                'sky': [(135, 206, 235), (176, 224, 230), (255, 255, 255)],    # Sky blue
-                'ocean': [(25, 25, 112), (100, 149, 237), (255, 255, 255)],    # Deep blue
-                'default': [(147, 112, 219), (221, 160, 221), (255, 255, 255)] # Purple theme
-            }
-            
-            # Choose color scheme
-            scheme_key = 'default'
-            prompt_lower = prompt.lower()
-            for key in color_schemes:
-                if key in prompt_lower:
-                    scheme_key = key
-                    break
-            
-            colors = color_schemes[scheme_key]
-            
-            # Create gradient background
-            img = Image.new('RGB', (width, height), colors[0])
-            draw = ImageDraw.Draw(img)
-            
-            # Create gradient effect
-            for i in range(height):
-                ratio = i / height
-                r = int(colors[0][0] * (1 - ratio) + colors[1][0] * ratio)
-                g = int(colors[0][1] * (1 - ratio) + colors[1][1] * ratio)
-                b = int(colors[0][2] * (1 - ratio) + colors[1][2] * ratio)
-                draw.line([(0, i), (width, i)], fill=(r, g, b))
-            
-            # Add some texture based on theme
-            if scheme_key == 'beach':
-                # Add wave-like patterns
-                for y in range(0, height, 40):
-                    for x in range(0, width, 80):
-                        draw.arc([x-20, y-10, x+20, y+10], 0, 180, fill=(255, 255, 255, 50))
-            elif scheme_key == 'mountain':
-                # Add triangle shapes for mountains
-                for i in range(5):
-                    x = i * (width // 5)
-                    draw.polygon([(x, height), (x + width//10, height//2), (x + width//5, height)], 
-                               fill=(colors[2][0], colors[2][1], colors[2][2], 80))
-            
-            # Try to use better fonts
-            try:
-                title_font = ImageFont.truetype("arial.ttf", 36)
-                font = ImageFont.truetype("arial.ttf", 18)
-                small_font = ImageFont.truetype("arial.ttf", 14)
-            except:
-                title_font = ImageFont.load_default()
-                font = ImageFont.load_default()
-                small_font = ImageFont.load_default()
-            
-            # Draw title with shadow
-            title = f"🎨 {prefix.title()} Preview"
-            title_bbox = draw.textbbox((0, 0), title, font=title_font)
-            title_width = title_bbox[2] - title_bbox[0]
-            title_x = (width - title_width) // 2
-            
-            # Shadow
-            draw.text((title_x + 2, 42), title, fill=(0, 0, 0, 100), font=title_font)
-            # Main text
-            draw.text((title_x, 40), title, fill=(255, 255, 255), font=title_font)
-            
-            # Draw prompt text in a nice box
-            box_padding = 50
-            box_top = 140
-            box_bottom = height - 140
-            
-            # Draw semi-transparent box
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            overlay_draw.rectangle([box_padding, box_top, width-box_padding, box_bottom], 
-                                 fill=(255, 255, 255, 220))
-            img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-            
-            # Wrap and draw prompt text
-            wrapped_text = textwrap.fill(prompt, width=65)
-            lines = wrapped_text.split('\n')
-            
-            total_text_height = len(lines) * 22
-            start_y = (height - total_text_height) // 2
-            
-            for i, line in enumerate(lines):
-                bbox = draw.textbbox((0, 0), line, font=font)
-                line_width = bbox[2] - bbox[0]
-                x = (width - line_width) // 2
-                y = start_y + (i * 22)
-                draw.text((x, y), line, fill=(60, 60, 60), font=font)
-            
-            # Add status message
-            status_msg = "🔄 AI services busy - Themed placeholder generated"
-            status_bbox = draw.textbbox((0, 0), status_msg, font=small_font)
-            status_width = status_bbox[2] - status_bbox[0]
-            status_x = (width - status_width) // 2
-            draw.text((status_x, height - 80), status_msg, fill=(255, 255, 255), font=small_font)
-            
-            # Add footer
-            footer = "Try again later • AI will generate your exact image"
-            footer_bbox = draw.textbbox((0, 0), footer, font=small_font)
-            footer_width = footer_bbox[2] - footer_bbox[0]
-            footer_x = (width - footer_width) // 2
-            draw.text((footer_x, height - 50), footer, fill=(255, 255, 255), font=small_font)
-            
-            # Save image
+            with timing.stage('placeholder_render', kind=prefix):
+                img = rendering.render_background_placeholder(prompt, prefix, width, height)
             filename = f"{prefix}_themed_{uuid.uuid4().hex[:8]}.png"
-            media_dir = os.path.join(settings.MEDIA_ROOT, 'generated_images')
-            os.makedirs(media_dir, exist_ok=True)
-            filepath = os.path.join(media_dir, filename)
-            
-            img.save(filepath, quality=95)
-            print(f"✅ Themed placeholder for {prefix} created: {filename}")
-            return f"{settings.MEDIA_URL}generated_images/{filename}"
-            
-        except Exception as e:
-            print(f"Enhanced placeholder creation failed: {e}")
+            image_url = storage.save_image(img, filename, quality=95)
+            logger.info("Themed placeholder for %s created: %s", prefix, filename)
+            return image_url
+        except Exception:
+            logger.exception("Placeholder creation failed for %s", prefix)
             return None
     
     @staticmethod
     def _create_character_placeholder(prompt, prefix, width=768, height=1024):
         """Create VERTICAL character-specific placeholder"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            import textwrap
-            
-            # Character-themed color schemes
-            character_schemes = {
-                'knight': [(70, 70, 70), (150, 150, 150), (220, 220, 220)],      # Metallic gray
-                'warrior': [(139, 69, 19), (160, 82, 45), (222, 184, 135)],      # Brown/bronze
-                'wizard': [(75, 0, 130), (138, 43, 226), (221, 160, 221)],       # Purple/violet
-                'mage': [(25, 25, 112), (65, 105, 225), (173, 216, 230)],        # Blue theme
-                'archer': [(34, 139, 34), (107, 142, 35), (154, 205, 50)],       # Green theme
-                'rogue': [(47, 79, 79), (105, 105, 105), (169, 169, 169)],       # Dark gray
-                'paladin': [(255, 215, 0), (255, 255, 224), (255, 255, 255)],    # Gold/white
-                'default': [(105, 105, 105), (169, 169, 169), (211, 211, 211)]   # Gray theme
-            }
-            
-            # Choose color scheme based on character type
-            scheme_key = 'default'
-            prompt_lower = prompt.lower()
-            for key in character_schemes:
-                if key in prompt_lower:
-                    scheme_key = key
-                    break
-            
-            colors = character_schemes[scheme_key]
-            
-            # Create VERTICAL background
-            img = Image.new('RGB', (width, height), colors[0])
-            draw = ImageDraw.Draw(img)
-            
-            # Create vertical gradient background
-            for i in range(height):
-                ratio = i / height
-                r = int(colors[0][0] * (1 - ratio) + colors[1][0] * ratio)
-                g = int(colors[0][1] * (1 - ratio) + colors[1][1] * ratio)  
-                b = int(colors[0][2] * (1 - ratio) + colors[1][2] * ratio)
-                draw.line([(0, i), (width, i)], fill=(r, g, b))
-            
-            # Draw FULL BODY character silhouette
-            center_x = width // 2
-            
-            # Head (top portion)
-            head_radius = 45
-            head_y = 120
-            draw.ellipse([center_x - head_radius, head_y, 
-                         center_x + head_radius, head_y + head_radius * 2], 
-                        fill=(colors[2][0], colors[2][1], colors[2][2], 120))
-            
-            # Torso (middle portion)
-            torso_width = 80
-            torso_top = head_y + head_radius * 2
-            torso_bottom = torso_top + 200
-            draw.rectangle([center_x - torso_width//2, torso_top, 
-                           center_x + torso_width//2, torso_bottom], 
-                          fill=(colors[2][0], colors[2][1], colors[2][2], 100))
-            
-            # Legs (bottom portion) - FULL BODY
-            leg_width = 25
-            leg_top = torso_bottom
-            leg_bottom = height - 150
-            
-            # Left leg
-            draw.rectangle([center_x - torso_width//4 - leg_width//2, leg_top, 
-                           center_x - torso_width//4 + leg_width//2, leg_bottom], 
-                          fill=(colors[2][0], colors[2][1], colors[2][2], 100))
-            
-            # Right leg
-            draw.rectangle([center_x + torso_width//4 - leg_width//2, leg_top, 
-                           center_x + torso_width//4 + leg_width//2, leg_bottom], 
-                          fill=(colors[2][0], colors[2][1], colors[2][2], 100))
-            
-            # Arms
-            arm_width = 20
-            arm_length = 120
-            arm_y = torso_top + 30
-            
-            # Left arm
-            draw.rectangle([center_x - torso_width//2 - arm_width, arm_y, 
-                           center_x - torso_width//2, arm_y + arm_length], 
-                          fill=(colors[2][0], colors[2][1], colors[2][2], 100))
-            
-            # Right arm
-            draw.rectangle([center_x + torso_width//2, arm_y, 
-                           center_x + torso_width//2 + arm_width, arm_y + arm_length], 
-                          fill=(colors[2][0], colors[2][1], colors[2][2], 100))
-            
-            # Try to use better fonts
-            try:
-                title_font = ImageFont.truetype("arial.ttf", 24)
-                font = ImageFont.truetype("arial.ttf", 14)
-                small_font = ImageFont.truetype("arial.ttf", 12)
-            except:
-                title_font = ImageFont.load_default()
-                font = ImageFont.load_default()
-                small_font = ImageFont.load_default()
-            
-            # Draw title at top
-            title = "🛡️ Full Body Character"
-            title_bbox = draw.textbbox((0, 0), title, font=title_font)
-            title_width = title_bbox[2] - title_bbox[0]
-            title_x = (width - title_width) // 2
-            
-            # Shadow
-            draw.text((title_x + 1, 31), title, fill=(0, 0, 0, 100), font=title_font)
-            # Main text
-            draw.text((title_x, 30), title, fill=(255, 255, 255), font=title_font)
-            
-            # Draw character description at bottom
-            box_padding = 20
-            box_top = leg_bottom + 20
-            box_bottom = height - 40
-            
-            # Draw semi-transparent box for text
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            overlay_draw.rectangle([box_padding, box_top, width-box_padding, box_bottom], 
-                                 fill=(255, 255, 255, 200))
-            img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-            
-            # Wrap and draw character description
-            wrapped_text = textwrap.fill(prompt.replace("full body portrait of ", ""), width=35)
-            lines = wrapped_text.split('\n')
-            
-            y_offset = box_top + 10
-            for line in lines[:3]:  # Limit to 3 lines
-                bbox = draw.textbbox((0, 0), line, font=font)
-                line_width = bbox[2] - bbox[0]
-                x = (width - line_width) // 2
-                draw.text((x, y_offset), line, fill=(60, 60, 60), font=font)
-                y_offset += 16
-            
-            # Add status message
-            status_msg = "AI Character Generator Busy"
-            status_bbox = draw.textbbox((0, 0), status_msg, font=small_font)
-            status_width = status_bbox[2] - status_bbox[0]
-            status_x = (width - status_width) // 2
-            draw.text((status_x, height - 25), status_msg, fill=(255, 255, 255), font=small_font)
-            
-            # Save image
+            with timing.stage('placeholder_render', kind=prefix):
+                img = rendering.render_character_placeholder(prompt, width, height)
             filename = f"{prefix}_fullbody_{uuid.uuid4().hex[:8]}.png"
-            media_dir = os.path.join(settings.MEDIA_ROOT, 'generated_images')
-            os.makedirs(media_dir, exist_ok=True)
-            filepath = os.path.join(media_dir, filename)
-            
-            img.save(filepath, quality=95)
-            print(f"✅ VERTICAL full body character placeholder created: {filename}")
-            return f"{settings.MEDIA_URL}generated_images/{filename}"
-            
-        except Exception as e:
-            print(f"Character placeholder creation failed: {e}")
+            image_url = storage.save_image(img, filename, quality=95)
+            logger.info("Full body character placeholder created: %s", filename)
+            return image_url
+        except Exception:
+            logger.exception("Character placeholder creation failed")
             return None
     
     @staticmethod
-    def generate_image(prompt):
-        """Generate scene image"""
-        print(f"🚀 Starting scene image generation")
-        print(f"📝 Scene prompt: {prompt}")
+    def generate_image(prompt, seed=None, placeholder=True):
+        """Generate scene image; with placeholder=False, None if the provider fails"""
+        logger.info("Generating scene image: %s", prompt)
         
         # Try AI services first
-        result = ImageGenerationService._try_pollinations_with_retry(prompt, "scene")
-        if result:
+        result = ImageGenerationService._try_pollinations_with_retry(prompt, "scene", seed=seed)
+        if result or not placeholder:
             return result
         
         # Create enhanced placeholder (NO random photos!)
-        print("⚠️ AI services unavailable - creating themed placeholder")
+        logger.warning("Image provider unavailable; rendering a scene placeholder")
         result = ImageGenerationService._create_enhanced_placeholder(prompt, "scene")
         return result
     
     @staticmethod
-    def generate_character_image(description):
+    def generate_character_image(description, seed=None, placeholder=True):
         """Generate VERTICAL FULL BODY character image"""
         # Enhanced prompt for full body vertical characters
-        enhanced_prompt = f"full body portrait of {description}, standing, vertical orientation, complete figure, detailed character art, fantasy style"
+        enhanced_prompt = ImageGenerationService.CHARACTER_PROMPT.format(description=description)
         
-        print(f"🚀 Starting VERTICAL character image generation")
-        print(f"📝 Character prompt: {enhanced_prompt}")
+        logger.info("Generating character image: %s", enhanced_prompt)
         
         # Try AI services first with VERTICAL dimensions
         result = ImageGenerationService._try_pollinations_with_retry(
             enhanced_prompt, "character", 
-            width=768, height=1024  # VERTICAL aspect ratio
+            width=768, height=1024,  # VERTICAL aspect ratio
+            seed=seed
         )
-        if result:
+        if result or not placeholder:
             return result
         
         # Create character-specific placeholder (VERTICAL)
-        print("⚠️ AI services unavailable - creating VERTICAL character placeholder")
+        logger.warning("Image provider unavailable; rendering a character placeholder")
         result = ImageGenerationService._create_character_placeholder(
             enhanced_prompt, "character", 
             width=768, height=1024  # VERTICAL aspect ratio
@@ -434,25 +645,545 @@ class ImageGenerationService:
         return result
     
     @staticmethod
-    def generate_background_image(description):
+    def generate_background_image(description, seed=None, placeholder=True):
         """Generate HORIZONTAL background image - NO random photos, themed placeholders"""
-        enhanced_prompt = f"{description} landscape environment wide view"
+        enhanced_prompt = ImageGenerationService.BACKGROUND_PROMPT.format(description=description)
         
-        print(f"🚀 Starting HORIZONTAL background image generation")
-        print(f"📝 Background prompt: {enhanced_prompt}")
+        logger.info("Generating background image: %s", enhanced_prompt)
         
         # Try AI services first with HORIZONTAL dimensions
         result = ImageGenerationService._try_pollinations_with_retry(
             enhanced_prompt, "background",
-            width=1024, height=768  # HORIZONTAL aspect ratio
+            width=1024, height=768,  # HORIZONTAL aspect ratio
+            seed=seed
         )
-        if result:
+        if result or not placeholder:
             return result
         
         # Create themed placeholder (HORIZONTAL)
-        print("⚠️ AI services unavailable - creating HORIZONTAL themed background placeholder")
+        logger.warning("Image provider unavailable; rendering a background placeholder")
         result = ImageGenerationService._create_enhanced_placeholder(
             enhanced_prompt, "background",
             width=1024, height=768  # HORIZONTAL aspect ratio
         )
         return result
+    
+    @staticmethod
+    async def agenerate_image(prompt, seed=None, placeholder=True):
+        logger.info("Generating scene image: %s", prompt)
+        result = await ImageGenerationService._atry_pollinations_with_retry(prompt, "scene", seed=seed)
+        if result or not placeholder:
+            return result
+        
+        logger.warning("Image provider unavailable; rendering a scene placeholder")
+        return await sync_to_async(ImageGenerationService._create_enhanced_placeholder, thread_sensitive=False)(
+            prompt, "scene"
+        )
+    
+    @staticmethod
+    async def agenerate_character_image(description, seed=None, placeholder=True):
+        enhanced_prompt = ImageGenerationService.CHARACTER_PROMPT.format(description=description)
+        logger.info("Generating character image: %s", enhanced_prompt)
+        result = await ImageGenerationService._atry_pollinations_with_retry(
+            enhanced_prompt, "character", width=768, height=1024, seed=seed
+        )
+        if result or not placeholder:
+            return result
+        
+        logger.warning("Image provider unavailable; rendering a character placeholder")
+        return await sync_to_async(ImageGenerationService._create_character_placeholder, thread_sensitive=False)(
+            enhanced_prompt, "character", width=768, height=1024
+        )
+    
+    @staticmethod
+    async def agenerate_background_image(description, seed=None, placeholder=True):
+        enhanced_prompt = ImageGenerationService.BACKGROUND_PROMPT.format(description=description)
+        logger.info("Generating background image: %s", enhanced_prompt)
+        result = await ImageGenerationService._atry_pollinations_with_retry(
+            enhanced_prompt, "background", width=1024, height=768, seed=seed
+        )
+        if result or not placeholder:
+            return result
+        
+        logger.warning("Image provider unavailable; rendering a background placeholder")
+        return await sync_to_async(ImageGenerationService._create_enhanced_placeholder, thread_sensitive=False)(
+            enhanced_prompt, "background", width=1024, height=768
+        )
+    
+    @staticmethod
+    def _generator(kind):
+        return {
+            'background': ImageGenerationService.generate_background_image,
+            'character': ImageGenerationService.generate_character_image,
+            'scene': ImageGenerationService.generate_image,
+        }[kind]
+    
+    @staticmethod
+    def _agenerator(kind):
+        return {
+            'background': ImageGenerationService.agenerate_background_image,
+            'character': ImageGenerationService.agenerate_character_image,
+            'scene': ImageGenerationService.agenerate_image,
+        }[kind]
+    
+    @staticmethod
+    def placeholder_image(kind, description):
+        """The placeholder generate_<kind> falls back to when the provider fails"""
+        prompt = ImageGenerationService.PROMPTS[kind].format(description=description)
+        logger.warning("Image provider unavailable; rendering a %s placeholder", kind)
+        if kind == 'character':
+            return ImageGenerationService._create_character_placeholder(prompt, kind, width=768, height=1024)
+        return ImageGenerationService._create_enhanced_placeholder(prompt, kind)
+    
+    @staticmethod
+    def generate_seeded(kind, description, seed=None):
+        """kind's image for description as (image_url, seed), with its default
+        seed unless one is given. If the provider fails the image is a
+        placeholder and the seed None, since it would reproduce nothing."""
+        seed = seed or ImageGenerationService.default_seed(kind, description)
+        image_url = ImageGenerationService._generator(kind)(description, seed=seed, placeholder=False)
+        if image_url:
+            return image_url, seed
+        return ImageGenerationService.placeholder_image(kind, description), None
+    
+    @staticmethod
+    async def agenerate_seeded(kind, description, seed=None):
+        seed = seed or ImageGenerationService.default_seed(kind, description)
+        image_url = await ImageGenerationService._agenerator(kind)(description, seed=seed, placeholder=False)
+        if image_url:
+            return image_url, seed
+        placeholder = sync_to_async(ImageGenerationService.placeholder_image, thread_sensitive=False)
+        return await placeholder(kind, description), None
+    
+    @staticmethod
+    def generate_variants(kind, description, seeds):
+        """Generate kind's image for description once per seed, all at the same
+        time. Returns [{'seed', 'image_url'}] in seed order, without the seeds
+        that got no image."""
+        generate = ImageGenerationService._generator(kind)
+        
+        def generate_seed(seed):
+            try:
+                return generate(description, seed=seed, placeholder=False)
+            finally:
+                # Pool threads get their own DB connections; do not leak them
+                connections.close_all()
+        
+        with ThreadPoolExecutor(max_workers=len(seeds), thread_name_prefix=f'variants-{kind}') as executor:
+            # Copied contexts keep the request budget and timing stages on the pool threads
+            futures = [executor.submit(contextvars.copy_context().run, generate_seed, seed) for seed in seeds]
+            image_urls = [future.result() for future in futures]
+        return [
+            {'seed': seed, 'image_url': image_url}
+            for seed, image_url in zip(seeds, image_urls) if image_url
+        ]
+
+
+class SceneCompositor:
+    """Build scene images locally by layering a character onto a background"""
+
+    CANVAS_SIZE = (1024, 768)
+    CHARACTER_HEIGHT = 0.8  # Fraction of the canvas height
+    GROUND_MARGIN = 0.04  # Gap between the character's feet and the bottom edge
+    SLOT_CENTERS = {'left': 0.25, 'center': 0.5, 'right': 0.75}
+    MATTE_THRESHOLD = 40  # Per-pixel distance from the backdrop colour counted as foreground
+    SHADOW_OFFSET = (18, 12)
+    SHADOW_OPACITY = 0.45
+
+    @staticmethod
+    def media_path(image_url):
+        """Map a /media/... URL back to its file under MEDIA_ROOT"""
+        relative = storage.relative_path(image_url)
+        path = relative and storage.absolute_path(relative)
+        return path if path and os.path.exists(path) else None
+
+    @staticmethod
+    def _matte(character):
+        """Give the character an alpha channel, keying out a flat backdrop
+        estimated from the image corners when it has no transparency"""
+        from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+        if character.mode == 'RGBA' and ImageStat.Stat(character.getchannel('A')).extrema[0][0] < 255:
+            return character
+
+        rgb = character.convert('RGB')
+        w, h = rgb.size
+        patch = max(4, min(w, h) // 20)
+        corners = [
+            rgb.crop(box) for box in (
+                (0, 0, patch, patch), (w - patch, 0, w, patch),
+                (0, h - patch, patch, h), (w - patch, h - patch, w, h),
+            )
+        ]
+        backdrop = tuple(
+            int(sum(ImageStat.Stat(c).mean[band] for c in corners) / len(corners))
+            for band in range(3)
+        )
+
+        # Largest channel difference from the backdrop, thresholded and feathered
+        diff = ImageChops.difference(rgb, Image.new('RGB', rgb.size, backdrop))
+        r, g, b = diff.split()
+        distance = ImageChops.lighter(ImageChops.lighter(r, g), b)
+        threshold = SceneCompositor.MATTE_THRESHOLD
+        alpha = distance.point(lambda v: 255 if v > threshold else 0)
+        alpha = alpha.filter(ImageFilter.MinFilter(3)).filter(ImageFilter.GaussianBlur(2))
+
+        matted = rgb.convert('RGBA')
+        matted.putalpha(alpha)
+        return matted
+
+    @staticmethod
+    def _shadow(alpha):
+        """Soft black silhouette used as a drop shadow"""
+        from PIL import Image, ImageFilter
+
+        opacity = SceneCompositor.SHADOW_OPACITY
+        shadow_alpha = alpha.point(lambda v: int(v * opacity)).filter(ImageFilter.GaussianBlur(8))
+        shadow = Image.new('RGBA', alpha.size, (0, 0, 0, 0))
+        shadow.putalpha(shadow_alpha)
+        return shadow
+
+    @staticmethod
+    def compose(background_url, character_url, position, prefix='scene'):
+        """Layer the character onto the background at the given slot.
+        Returns the new image URL, or None when either source file is missing."""
+        background_path = SceneCompositor.media_path(background_url)
+        character_path = SceneCompositor.media_path(character_url)
+        if not background_path or not character_path:
+            return None
+
+        try:
+            from PIL import Image, ImageOps
+
+            with timing.stage('composite'):
+                width, height = SceneCompositor.CANVAS_SIZE
+                with Image.open(background_path) as bg:
+                    canvas = ImageOps.fit(bg.convert('RGB'), (width, height), Image.LANCZOS).convert('RGBA')
+
+                with Image.open(character_path) as char:
+                    has_alpha = 'A' in char.getbands() or 'transparency' in char.info
+                    character = SceneCompositor._matte(char.convert('RGBA' if has_alpha else 'RGB'))
+
+                # Scale the character to a fixed share of the canvas height
+                target_h = int(height * SceneCompositor.CHARACTER_HEIGHT)
+                target_w = max(1, int(character.width * target_h / character.height))
+                character = character.resize((target_w, target_h), Image.LANCZOS)
+
+                center = SceneCompositor.SLOT_CENTERS.get(position, 0.5)
+                x = int(width * center - target_w / 2)
+                x = min(max(x, 0), max(width - target_w, 0))
+                y = height - target_h - int(height * SceneCompositor.GROUND_MARGIN)
+
+                dx, dy = SceneCompositor.SHADOW_OFFSET
+                canvas.alpha_composite(SceneCompositor._shadow(character.getchannel('A')), (x + dx, y + dy))
+                canvas.alpha_composite(character, (x, y))
+
+            filename = f"{prefix}_composite_{uuid.uuid4().hex[:8]}.jpg"
+            image_url = storage.save_image(canvas.convert('RGB'), filename, quality=90)
+
+            logger.info("Composited %s image saved: %s", prefix, filename)
+            return image_url
+        except Exception:
+            logger.exception("Scene compositing failed")
+            return None
+
+    @staticmethod
+    async def acompose(background_url, character_url, position, prefix='scene'):
+        """compose() on a worker thread, keeping Pillow off the event loop"""
+        return await sync_to_async(SceneCompositor.compose, thread_sensitive=False)(
+            background_url, character_url, position, prefix
+        )
+
+
+class GenerationJobService:
+    """Queue image generation as GenerationJob rows and run them from a worker"""
+
+    @staticmethod
+    def enqueue(target, user, **options):
+        """Create a pending job for a Background, Character or Scene"""
+        kind = target._meta.model_name
+        job = GenerationJob.objects.create(
+            kind=kind,
+            created_by=user,
+            options=options,
+            **{kind: target}
+        )
+        logger.info("Queued %s", job)
+        return job
+
+    @staticmethod
+    def claim_next():
+        """Atomically move the oldest pending job to running and return it"""
+        while True:
+            job = GenerationJob.objects.filter(
+                status=GenerationJob.STATUS_PENDING
+            ).order_by('created_at', 'id').first()
+            if job is None:
+                return None
+
+            # Only one worker wins the conditional update; losers look again
+            claimed = GenerationJob.objects.filter(
+                pk=job.pk, status=GenerationJob.STATUS_PENDING
+            ).update(
+                status=GenerationJob.STATUS_RUNNING,
+                started_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    @staticmethod
+    def requeue_stale(stale_after):
+        """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        stale = GenerationJob.objects.filter(
+            status=GenerationJob.STATUS_RUNNING, started_at__lt=cutoff
+        )
+        exhausted = stale.filter(attempts__gte=settings.GENERATION_JOB_MAX_ATTEMPTS).update(
+            status=GenerationJob.STATUS_FAILED,
+            error='Worker stopped before the job finished',
+            finished_at=timezone.now(),
+        )
+        requeued = stale.update(status=GenerationJob.STATUS_PENDING)
+        return requeued + exhausted
+
+    @staticmethod
+    def run(job):
+        """Generate the image for a claimed job and record the outcome"""
+        runners = {
+            GenerationJob.KIND_BACKGROUND: GenerationJobService._run_background,
+            GenerationJob.KIND_CHARACTER: GenerationJobService._run_character,
+            GenerationJob.KIND_SCENE: GenerationJobService._run_scene,
+        }
+        try:
+            image_url = runners[job.kind](job)
+        except AdmissionRejected as e:
+            # The provider is saturated: back to the queue without spending an attempt
+            logger.info("%s deferred: %s", job, e)
+            GenerationJob.objects.filter(pk=job.pk).update(
+                status=GenerationJob.STATUS_PENDING, attempts=F('attempts') - 1
+            )
+            job.refresh_from_db()
+            return job
+        except Exception as e:
+            logger.exception("%s failed", job)
+            job.error = str(e)
+            image_url = None
+
+        if image_url:
+            job.status = GenerationJob.STATUS_SUCCEEDED
+            job.error = ''
+            try:
+                # Build gallery thumbnails now rather than on the first page view
+                thumbnails.build_derivatives(image_url)
+            except Exception as e:
+                logger.warning("Thumbnail generation failed for %s: %s", image_url, e)
+        elif job.attempts < settings.GENERATION_JOB_MAX_ATTEMPTS and job.error:
+            # Unexpected errors are retried; a clean "no image" result is final
+            job.status = GenerationJob.STATUS_PENDING
+        else:
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = job.error or 'Image generation failed'
+        job.finished_at = timezone.now() if job.is_finished else None
+        saved = GenerationJob.objects.filter(pk=job.pk).update(
+            status=job.status, error=job.error, finished_at=job.finished_at, variants=job.variants
+        )
+        if not saved:
+            # Deleting the Background, Character or Scene took its job with it
+            logger.info("%s was cancelled: its %s was deleted while it ran", job, job.kind)
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = f'Cancelled: the {job.kind} was deleted'
+        return job
+
+    @staticmethod
+    def _generate_seeded(job, description):
+        """Generate the job's image for description; returns (image_url, seed).
+
+        Reuses the target's saved seed, so a retried job reproduces its image.
+        With options['variants'] > 1 it generates that many seeds at once and
+        records them on job.variants for the user to choose from; the first
+        stands in until they do."""
+        kind = job.kind
+        count = job.options.get('variants', 1)
+        if count <= 1:
+            return ImageGenerationService.generate_seeded(kind, description, job.target.seed)
+
+        seeds = ImageGenerationService.variant_seeds(kind, description, count)
+        job.variants = ImageGenerationService.generate_variants(kind, description, seeds)
+        if job.variants:
+            return job.variants[0]['image_url'], job.variants[0]['seed']
+        # Nothing to choose from: a single placeholder, like a one-image job
+        return ImageGenerationService.placeholder_image(kind, description), None
+
+    @staticmethod
+    def _run_background(job):
+        background = job.background
+        ai_service = AIService.instance()
+        enhanced_desc = ai_service.enhance_description(background.description)
+        image_url, background.seed = GenerationJobService._generate_seeded(job, enhanced_desc)
+        # Kept so scene prompts can reuse it instead of asking Gemini again
+        background.enhanced_description = enhanced_desc
+        if image_url:
+            background.generated_image_url = image_url
+        background.save(update_fields=['enhanced_description', 'generated_image_url', 'seed'])
+        return image_url
+
+    @staticmethod
+    def _run_character(job):
+        character = job.character
+        ai_service = AIService.instance()
+        enhanced_desc = ai_service.enhance_description(character.description)
+        image_url, character.seed = GenerationJobService._generate_seeded(job, enhanced_desc)
+        # Kept so scene prompts can reuse it instead of asking Gemini again
+        character.enhanced_description = enhanced_desc
+        if image_url:
+            character.generated_image_url = image_url
+        character.save(update_fields=['enhanced_description', 'generated_image_url', 'seed'])
+        return image_url
+
+    @staticmethod
+    def _run_scene(job):
+        scene = job.scene
+        image_url = None
+        if scene.render_mode == scene.RENDER_COMPOSITE:
+            image_url = SceneCompositor.compose(
+                scene.background.image_url,
+                scene.character.image_url,
+                scene.character_position
+            )
+
+        if not image_url:
+            # AI repaint, or compositing was not possible (e.g. sources still generating)
+            ai_service = AIService.instance()
+            scene_prompt = ai_service.generate_scene_prompt(
+                scene.background.prompt_description,
+                scene.character.prompt_description,
+                scene.character_position,
+                scene.action_description
+            )
+            image_url, scene.seed = GenerationJobService._generate_seeded(job, scene_prompt)
+
+        if image_url:
+            scene.generated_image_url = image_url
+            scene.save(update_fields=['generated_image_url', 'seed'])
+        return image_url
+
+
+class BulkGenerationService:
+    """Create many backgrounds or characters at once, generating their images
+    concurrently on a bounded thread pool and saving rows in batches"""
+
+    KINDS = {
+        'background': Background,
+        'character': Character,
+    }
+
+    @staticmethod
+    def parse_items(data, fmt, max_items=None):
+        """Name/description dicts from JSON (a list of objects) or CSV (with a header row)"""
+        if fmt == 'json':
+            items = json.loads(data)
+            if not isinstance(items, list):
+                raise ValueError('Expected a JSON list of {"name", "description"} objects')
+        elif fmt == 'csv':
+            items = list(csv.DictReader(io.StringIO(data)))
+        else:
+            raise ValueError(f'Unsupported format: {fmt}')
+
+        parsed = []
+        for number, item in enumerate(items, start=1):
+            if not isinstance(item, dict):
+                raise ValueError(f'Item {number} is not an object')
+            name, description = item.get('name') or '', item.get('description') or ''
+            if not isinstance(name, str) or not isinstance(description, str):
+                raise ValueError(f'Item {number} needs a text name and description')
+            name, description = name.strip(), description.strip()
+            if not name or not description:
+                raise ValueError(f'Item {number} needs both a name and a description')
+            parsed.append({'name': name[:200], 'description': description})
+
+        if max_items and len(parsed) > max_items:
+            raise ValueError(f'At most {max_items} items per request')
+        return parsed
+
+    @staticmethod
+    def _generate(kind, enhanced_desc):
+        """Generate one item's image, as (image_url, seed); runs on a pool thread"""
+        try:
+            image_url, seed = ImageGenerationService.generate_seeded(kind, enhanced_desc)
+            if image_url:
+                thumbnails.build_derivatives(image_url)
+            return image_url, seed
+        finally:
+            # Pool threads get their own DB connections; do not leak them
+            connections.close_all()
+
+    @staticmethod
+    def run(kind, items, user, workers=None, batch_size=None):
+        """Yield a progress dict per finished item, then a final summary.
+        Rows are written with bulk_create every batch_size items. Closing the
+        generator early (a client gone mid-stream) cancels the items not yet
+        started and still saves the ones that finished."""
+        model = BulkGenerationService.KINDS[kind]
+        workers = workers or settings.BULK_GENERATION_WORKERS
+        batch_size = batch_size or settings.BULK_GENERATION_BATCH_SIZE
+        pending, created, failed = [], 0, 0
+
+        def flush():
+            nonlocal created
+            model.objects.bulk_create(pending)
+            created += len(pending)
+            pending.clear()
+
+        # One Gemini round trip for the whole batch instead of one per item
+        enhanced = AIService.instance().enhance_descriptions([item['description'] for item in items])
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'bulk-{kind}')
+        futures = {executor.submit(BulkGenerationService._generate, kind, enhanced[index]): index
+                   for index in range(len(items))}
+        recorded = set()
+
+        def record(future):
+            """Queue the row for a finished item; returns its progress fields"""
+            nonlocal failed
+            recorded.add(future)
+            index = futures[future]
+            item = items[index]
+            try:
+                image_url, seed = future.result()
+                error = None
+            except Exception as e:
+                logger.exception("Bulk %s item %d failed", kind, index)
+                image_url, seed, error = None, None, str(e)
+
+            failed += image_url is None
+            # Saved either way, like the single-item form; a missing image shows as "Processing"
+            pending.append(model(
+                name=item['name'], description=item['description'],
+                enhanced_description=enhanced[index], seed=seed,
+                generated_image_url=image_url, created_by=user,
+            ))
+            if len(pending) >= batch_size:
+                flush()
+            return {
+                'index': index, 'name': item['name'],
+                'status': 'succeeded' if image_url else 'failed',
+                'image_url': image_url, 'error': error,
+            }
+
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                yield {'done': done, 'total': len(items), **record(future)}
+        finally:
+            # Left early when the stream is closed (the client went away) or the
+            # command interrupted: drop the queued items, wait out the running
+            # ones and keep what they produced
+            executor.shutdown(cancel_futures=True)
+            for future in futures:
+                if future not in recorded and not future.cancelled():
+                    record(future)
+            if pending:
+                flush()
+
+        yield {'summary': True, 'created': created, 'failed': failed, 'total': len(items)}
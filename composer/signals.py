@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import storage
+from .models import Background, Character, Scene
+
+
+@receiver(post_delete, sender=Background)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Scene)
+def release_generated_image(sender, instance, **kwargs):
+    """Remove the deleted row's image once the deletion has committed,
+    unless another row or the image cache still points at it"""
+    if settings.MEDIA_RELEASE_ON_DELETE and instance.generated_image_url:
+        image_url = instance.generated_image_url
+        transaction.on_commit(lambda: storage.release(image_url))
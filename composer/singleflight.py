@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import deadlines, leases
+from .metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """Coalesce identical in-flight generations onto one provider call.
+
+    Within a process, callers arriving while a call for the same key is
+    running wait for it and share its result. Across processes, the caller
+    that inserts the GenerationLease row makes the call; the others poll
+    until the lease is released and then read the result through lookup()
+    (the image cache). A lease whose owner went quiet past its expiry is
+    taken over, so a crashed worker cannot wedge a key.
+    """
+
+    _lock = threading.Lock()
+    _flights = {}  # key -> _Flight (sync callers)
+    _async_flights = {}  # (event loop, key) -> asyncio.Future
+
+    def __init__(self, key):
+        self.key = key
+        self.owner = uuid.uuid4().hex
+
+    @staticmethod
+    def _time_left():
+        """Seconds a waiter may still wait within the request budget, or None if unbounded"""
+        return deadlines.remaining(reserve=settings.DEADLINE_PLACEHOLDER_RESERVE)
+
+    def _run_leased(self, produce, lookup):
+        waited = False
+        while True:
+            if leases.acquire(self.key, self.owner, settings.SINGLE_FLIGHT_LEASE):
+                try:
+                    return produce()
+                finally:
+                    leases.release(self.key, self.owner)
+
+            if not waited:
+                logger.info("Waiting on another process generating %s", self.key[:16])
+                registry.inc('single_flight_waits_total', scope='cluster')
+                waited = True
+            while (state := leases.state(self.key)) == 'held' and self._time_left() != 0:
+                time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+            result = lookup()
+            if result or state != 'expired':
+                # Released without a result, the other process's failure is ours too;
+                # still held, our request budget ran out waiting for it
+                return result
+
+    def run(self, produce, lookup):
+        """Return produce(), or the result of an identical call already in flight"""
+        with self._lock:
+            flight = self._flights.get(self.key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[self.key] = _Flight()
+
+        if not leader:
+            registry.inc('single_flight_waits_total', scope='process')
+            flight.done.wait(self._time_left())
+            return flight.result  # Still None if the budget ran out first
+
+        try:
+            flight.result = self._run_leased(produce, lookup)
+            return flight.result
+        finally:
+            with self._lock:
+                del self._flights[self.key]
+            flight.done.set()
+
+    async def _arun_leased(self, aproduce, alookup):
+        waited = False
+        while True:
+            if await sync_to_async(leases.acquire)(self.key, self.owner, settings.SINGLE_FLIGHT_LEASE):
+                try:
+                    return await aproduce()
+                finally:
+                    await sync_to_async(leases.release)(self.key, self.owner)
+
+            if not waited:
+                logger.info("Waiting on another process generating %s", self.key[:16])
+                registry.inc('single_flight_waits_total', scope='cluster')
+                waited = True
+            while (state := await sync_to_async(leases.state)(self.key)) == 'held' and self._time_left() != 0:
+                await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+            result = await alookup()
+            if result or state != 'expired':
+                return result
+
+    async def arun(self, aproduce, alookup):
+        """run() for coroutines. Callers on the same event loop share a future;
+        sync callers in this process are coalesced through the lease instead."""
+        flight_key = (asyncio.get_running_loop(), self.key)
+        flight = self._async_flights.get(flight_key)
+        if flight is not None:
+            registry.inc('single_flight_waits_total', scope='process')
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), self._time_left())
+            except asyncio.TimeoutError:
+                return None
+
+        flight = self._async_flights[flight_key] = asyncio.get_running_loop().create_future()
+        result = None
+        try:
+            result = await self._arun_leased(aproduce, alookup)
+            return result
+        finally:
+            # Waiters get None if this caller failed or was cancelled
+            del self._async_flights[flight_key]
+            flight.set_result(result)
@@ -0,0 +1,177 @@
+import hashlib
+import itertools
+import logging
+import os
+import re
+import time
+import urllib.parse
+
+from django.conf import settings
+
+from . import timing
+
+
+logger = logging.getLogger(__name__)
+
+GENERATED_DIR = 'generated_images'
+DERIVATIVES_DIR = 'derivatives'
+TEMP_PREFIXES = ('.download-', '.thumb-')
+
+
+def relative_path(image_url):
+    """Path under MEDIA_ROOT for a /media/... URL, or None for anything else"""
+    if not image_url or not image_url.startswith(settings.MEDIA_URL):
+        return None
+    return urllib.parse.unquote(image_url[len(settings.MEDIA_URL):])
+
+
+def absolute_path(relative):
+    return os.path.join(settings.MEDIA_ROOT, relative)
+
+
+def url_for(relative):
+    return f"{settings.MEDIA_URL}{relative.replace(os.sep, '/')}"
+
+
+def allocate(filename):
+    """Sharded relative path for a new generated file, e.g.
+    generated_images/3f/a2/background_poll_def_1234.jpg, with its directory created.
+    Sharding keeps every directory small however many images accumulate."""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    shards = [digest[i * 2:i * 2 + 2] for i in range(settings.MEDIA_SHARD_DEPTH)]
+    relative = os.path.join(GENERATED_DIR, *shards, filename)
+    os.makedirs(os.path.dirname(absolute_path(relative)), exist_ok=True)
+    return relative
+
+
+def save_image(img, filename, **save_options):
+    """Save a PIL image as a new generated file and return its URL"""
+    relative = allocate(filename)
+    with timing.stage('file_write') as step:
+        img.save(absolute_path(relative), **save_options)
+        step.size_bytes = os.path.getsize(absolute_path(relative))
+    return url_for(relative)
+
+
+def _reference_sources():
+    from .models import Background, CachedImage, Character, Scene
+
+    return [
+        (Background, 'generated_image_url'),
+        (Character, 'generated_image_url'),
+        (Scene, 'generated_image_url'),
+        (CachedImage, 'image_url'),  # The cache owns its files until it evicts them
+    ]
+
+
+def _variant_urls(image_url=None):
+    """Images variants-mode jobs still offer for choosing (GenerationJob.variants),
+    narrowed to the jobs whose JSON mentions image_url when it is given"""
+    from .models import GenerationJob
+
+    jobs = GenerationJob.objects.exclude(variants=[])
+    if image_url:
+        jobs = jobs.filter(variants__icontains=image_url)
+    for variants in jobs.values_list('variants', flat=True).iterator():
+        for variant in variants:
+            yield variant['image_url']
+
+
+def is_referenced(image_url, include_cache=True):
+    return any(
+        model.objects.filter(**{field: image_url}).exists()
+        for model, field in _reference_sources()
+        if include_cache or field != 'image_url'
+    ) or image_url in _variant_urls(image_url)
+
+
+def referenced_paths():
+    """Relative paths of every generated file something still points at"""
+    paths = set()
+    urls = itertools.chain.from_iterable(
+        model.objects.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True).iterator()
+        for model, field in _reference_sources()
+    )
+    for url in itertools.chain(urls, _variant_urls()):
+        relative = relative_path(url)
+        if relative:
+            paths.add(os.path.normpath(relative))
+    return paths
+
+
+def derivative_paths(relative):
+    """Existing thumbnails built from relative (see composer.thumbnails)"""
+    stem = os.path.splitext(relative)[0]
+    directory = absolute_path(os.path.join(DERIVATIVES_DIR, os.path.dirname(stem)))
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r'_w\d+\.\w+$')
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names if pattern.match(name)]
+
+
+def remove(relative):
+    """Delete a generated file and its thumbnails; returns bytes freed"""
+    freed = 0
+    for path in [absolute_path(relative)] + derivative_paths(relative):
+        try:
+            freed += os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+def release(image_url):
+    """Drop a file once its last reference is gone (called after a row is deleted)"""
+    relative = relative_path(image_url)
+    if not relative or not relative.startswith(GENERATED_DIR + '/'):
+        return 0
+    if is_referenced(image_url):
+        return 0
+    freed = remove(relative)
+    if freed:
+        logger.info("Released unreferenced media %s (%d bytes)", relative, freed)
+    return freed
+
+
+def find_orphans(min_age):
+    """Yield (relative path, size) for generated files and thumbnails that no
+    row references and that are older than min_age seconds (so files being
+    written right now are left alone)."""
+    referenced = referenced_paths()
+    cutoff = time.time() - min_age
+    listings = {}
+
+    def source_exists(source_stem):
+        directory = absolute_path(os.path.dirname(source_stem))
+        if directory not in listings:
+            try:
+                listings[directory] = {os.path.splitext(n)[0] for n in os.listdir(directory)}
+            except FileNotFoundError:
+                listings[directory] = set()
+        return os.path.basename(source_stem) in listings[directory]
+
+    for top in (GENERATED_DIR, DERIVATIVES_DIR):
+        for dirpath, _, filenames in os.walk(absolute_path(top)):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    continue
+
+                relative = os.path.normpath(os.path.relpath(path, settings.MEDIA_ROOT))
+                if name.startswith(TEMP_PREFIXES):
+                    yield relative, stat.st_size  # Abandoned partial write
+                elif top == GENERATED_DIR:
+                    if relative not in referenced:
+                        yield relative, stat.st_size
+                else:
+                    # A thumbnail is garbage once its source is gone
+                    source_stem = os.path.relpath(relative, DERIVATIVES_DIR).rsplit('_w', 1)[0]
+                    if not source_exists(source_stem):
+                        yield relative, stat.st_size
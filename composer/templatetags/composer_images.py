@@ -0,0 +1,38 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from composer import thumbnails
+
+
+register = template.Library()
+
+
+def _srcset(candidates):
+    return ', '.join(f"{url} {width}w" for url, width in candidates)
+
+
+@register.simple_tag
+def responsive_image(image_url, alt='', css_class='', style='', sizes=None):
+    """<picture> with WebP and JPEG srcsets so cards download a thumbnail
+    instead of the full-size generated image"""
+    if not image_url:
+        return ''
+
+    attrs = format_html_join(
+        ' ', '{}="{}"',
+        ((name, value) for name, value in (('class', css_class), ('style', style)) if value),
+    )
+    variants = thumbnails.get_variants(image_url)
+    if not variants or len(variants['jpg']) < 2:
+        return format_html('<img src="{}" alt="{}" loading="lazy" decoding="async" {}>', image_url, alt, attrs)
+
+    sizes = sizes or settings.THUMBNAIL_SIZES
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async" {}>'
+        '</picture>',
+        _srcset(variants['webp']), sizes,
+        variants['jpg'][0][0], _srcset(variants['jpg']), sizes, alt, attrs,
+    )
@@ -0,0 +1,168 @@
+import json
+import re
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .forms import SceneForm
+from .models import Background, GenerationJob
+from .services import BulkGenerationService
+from .pagination import encode_cursor, keyset_queryset
+from .views import LIBRARY_FEEDS
+
+
+# Markers of an extra sort step in EXPLAIN output, per backend
+SORT_MARKERS = ('USE TEMP B-TREE FOR ORDER BY', 'Sort Key', 'Using filesort')
+
+# An index seek bounded by a created_at range, per backend; {index} is the index name
+RANGE_SEEKS = {
+    'sqlite': r'SEARCH \S+ USING (?:COVERING )?INDEX {index} \([^)]*\bcreated_at<',
+    'postgresql': r'Index (?:Only )?Scan using {index} .*\n.*Index Cond: .*created_at <',
+}
+
+INDEX_NAMES = {
+    'backgrounds': 'background_owner_recent_idx',
+    'characters': 'character_owner_recent_idx',
+    'scenes': 'scene_owner_recent_idx',
+}
+
+
+class QueryPlanTests(TestCase):
+    """The hot per-user listing and queue queries, built through the real view,
+    form and pagination code, keep using their composite indexes without a
+    separate sort step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('plans')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make a sequential scan look cheapest; judge the index itself.
+            # LOCAL lasts until the transaction TestCase wraps each test in is rolled back.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name, no_sort=True):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"does not use {index_name}:\n{plan}")
+        if no_sort:
+            for marker in SORT_MARKERS:
+                self.assertNotIn(marker, plan, f"needs a separate sort step:\n{plan}")
+
+    def test_library_first_pages(self):
+        for kind, (queryset, _, _) in LIBRARY_FEEDS.items():
+            with self.subTest(kind=kind):
+                self.assertUsesIndex(keyset_queryset(queryset(self.user), None)[:25], INDEX_NAMES[kind])
+
+    def test_library_next_pages(self):
+        # The cursor must bound the index range, not just filter rows read from its start
+        cursor = encode_cursor(SimpleNamespace(created_at=timezone.now(), pk=1))
+        for kind, (queryset, _, _) in LIBRARY_FEEDS.items():
+            with self.subTest(kind=kind):
+                page = keyset_queryset(queryset(self.user), cursor)[:25]
+                self.assertUsesIndex(page, INDEX_NAMES[kind])
+                if connection.vendor in RANGE_SEEKS:
+                    plan = page.explain()
+                    pattern = RANGE_SEEKS[connection.vendor].format(index=re.escape(INDEX_NAMES[kind]))
+                    self.assertRegex(plan, pattern, "does not seek to the cursor")
+
+    def test_scene_form_choices(self):
+        form = SceneForm(self.user)
+        self.assertUsesIndex(form.fields['background'].queryset, INDEX_NAMES['backgrounds'])
+        self.assertUsesIndex(form.fields['character'].queryset, INDEX_NAMES['characters'])
+
+    def test_worker_queue(self):
+        queue = GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING).order_by('created_at', 'id')[:1]
+        self.assertUsesIndex(queue, 'job_queue_idx')
+
+
+class BulkCreateTests(TestCase):
+    """Bulk imports are charged to their own allowance, not the per-generation bucket"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('bulk')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        ai = mock.Mock()
+        ai.enhance_descriptions.side_effect = lambda descriptions: list(descriptions)
+        patches = [
+            mock.patch('composer.services.AIService.instance', return_value=ai),
+            mock.patch('composer.services.ImageGenerationService.generate_seeded',
+                       return_value=('/media/generated_images/bulk.jpg', 7)),
+            mock.patch('composer.services.thumbnails.build_derivatives'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post(self, count):
+        items = [{'name': f'Item {n}', 'description': f'Scene number {n}'} for n in range(count)]
+        return self.client.post(reverse('bulk_create', args=['background']), json.dumps(items),
+                                content_type='application/json')
+
+    def test_batch_larger_than_user_burst(self):
+        count = settings.ADMISSION_USER_BURST + 5
+        response = self.post(count)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[-1], {'summary': True, 'created': count, 'failed': 0, 'total': count})
+        self.assertEqual(Background.objects.filter(created_by=self.user).count(), count)
+
+    def test_full_batch_then_rate_limited(self):
+        response = self.post(settings.BULK_GENERATION_MAX_ITEMS)
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        response = self.post(1)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_closed_stream_cancels_queued_items_and_saves_finished_ones(self):
+        generate = mock.patch('composer.services.ImageGenerationService.generate_seeded',
+                              side_effect=lambda *args: time.sleep(0.02) or ('/media/generated_images/bulk.jpg', 7))
+        with generate as generate_seeded:
+            items = [{'name': f'Item {n}', 'description': f'Scene number {n}'} for n in range(40)]
+            updates = BulkGenerationService.run('background', items, self.user, workers=2, batch_size=100)
+            next(updates)
+            updates.close()
+        # Every item that started was saved, though no batch filled up; the rest never ran
+        self.assertLess(generate_seeded.call_count, len(items))
+        self.assertEqual(Background.objects.filter(created_by=self.user).count(), generate_seeded.call_count)
+
+
+class JobVariantsTests(TestCase):
+    """Keeping a variant lets the files of the others go"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('variants')
+
+    def test_keeping_a_variant_releases_the_others(self):
+        urls = [f'/media/generated_images/variant_{seed}.jpg' for seed in (1, 2, 3)]
+        background = Background.objects.create(
+            name='Dunes', description='Sand', seed=1, generated_image_url=urls[0], created_by=self.user
+        )
+        job = GenerationJob.objects.create(
+            kind=GenerationJob.KIND_BACKGROUND, status=GenerationJob.STATUS_SUCCEEDED, background=background,
+            variants=[{'seed': seed, 'image_url': url} for seed, url in zip((1, 2, 3), urls)],
+            created_by=self.user,
+        )
+        self.client.force_login(self.user)
+        with mock.patch('composer.views.storage.release') as release, \
+                mock.patch('composer.views.thumbnails.build_derivatives'):
+            self.client.post(reverse('job_variants', args=[job.id]), {'seed': 2})
+
+        job.refresh_from_db()
+        background.refresh_from_db()
+        self.assertEqual(background.generated_image_url, urls[1])
+        self.assertEqual(job.variants, [{'seed': 2, 'image_url': urls[1]}])
+        self.assertEqual(sorted(call.args[0] for call in release.call_args_list), [urls[0], urls[2]])
@@ -0,0 +1,109 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from . import storage
+
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+ORIENTATION_TAG = 0x0112
+
+
+def _derivative_name(relative, width, ext):
+    stem = os.path.splitext(relative)[0]
+    return f"{storage.DERIVATIVES_DIR}/{stem}_w{width}.{ext}"
+
+
+def _write_atomic(img, path, options):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.thumb-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, **options)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _display_width(img):
+    """Width once EXIF rotation is applied, read from the header alone"""
+    width, height = img.size
+    # Orientations 5-8 turn the image on its side
+    return height if img.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8) else width
+
+
+def build_derivatives(image_url):
+    """Render every missing width/format variant of a media image.
+    Returns the number of files written."""
+    relative = storage.relative_path(image_url)
+    source = relative and os.path.join(settings.MEDIA_ROOT, relative)
+    if not source or not os.path.exists(source):
+        return 0
+
+    with Image.open(source) as original:
+        original_width = _display_width(original)
+        # Never upscale; the original serves the wider sizes
+        missing = [
+            (width, ext, path)
+            for width in settings.THUMBNAIL_WIDTHS if width < original_width
+            for ext in FORMATS
+            if not os.path.exists(path := os.path.join(settings.MEDIA_ROOT, _derivative_name(relative, width, ext)))
+        ]
+        if not missing:
+            return 0  # The common case on page views: nothing to decode
+
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        resized = {}
+        for width, ext, path in missing:
+            if width not in resized:
+                height = round(original.height * width / original.width)
+                resized[width] = original.resize((width, height), Image.LANCZOS)
+            _write_atomic(resized[width], path, FORMATS[ext])
+
+    logger.debug("Built %d derivative(s) for %s", len(missing), relative)
+    return len(missing)
+
+
+def get_variants(image_url):
+    """srcset candidates per format, building any that are missing on first use.
+
+    Returns {'webp': [(url, width), ...], 'jpg': [...]}, where the 'jpg' list
+    (used by the <img> fallback) also carries the original at full width, or
+    None when the image is not a local file.
+    """
+    relative = storage.relative_path(image_url)
+    source = relative and os.path.join(settings.MEDIA_ROOT, relative)
+    if not source or not os.path.exists(source):
+        return None
+
+    try:
+        with Image.open(source) as img:
+            original_width = _display_width(img)
+        build_derivatives(image_url)
+    except Exception as e:
+        logger.warning("Could not build derivatives for %s: %s", relative, e)
+        return None
+
+    variants = {ext: [] for ext in FORMATS}
+    for width in settings.THUMBNAIL_WIDTHS:
+        if width >= original_width:
+            continue
+        for ext in FORMATS:
+            name = _derivative_name(relative, width, ext)
+            variants[ext].append((storage.url_for(name), width))
+
+    variants['jpg'].append((image_url, original_width))
+    return variants
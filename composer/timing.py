@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from .metrics import DURATION_BUCKETS, SIZE_BUCKETS, registry
+
+
+logger = logging.getLogger(__name__)
+
+# Stages recorded while serving the current request (see ServerTimingMiddleware).
+# The list is shared with worker threads that run in a copy of the context.
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+class Stage:
+    """One timed step of a generation. Inside the block, set outcome (default
+    'ok', or 'error'/'cancelled' when it raises) and size_bytes if it moved a payload."""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.outcome = None
+        self.size_bytes = None
+        self.duration = None
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time a block as a generation stage: feeds the generation_stage_*
+    histograms, the log, and the current request's Server-Timing header"""
+    record = Stage(name, labels)
+    started = time.perf_counter()
+    try:
+        yield record
+    except asyncio.CancelledError:
+        record.outcome = 'cancelled'
+        raise
+    except Exception:
+        record.outcome = 'error'
+        raise
+    finally:
+        record.duration = time.perf_counter() - started
+        record.outcome = record.outcome or 'ok'
+        _record(record)
+
+
+def _record(record):
+    registry.observe(
+        'generation_stage_duration_seconds', record.duration, buckets=DURATION_BUCKETS,
+        stage=record.name, outcome=record.outcome, **record.labels
+    )
+    if record.size_bytes is not None:
+        registry.observe(
+            'generation_stage_bytes', record.size_bytes, buckets=SIZE_BUCKETS,
+            stage=record.name, **record.labels
+        )
+
+    details = ''.join(f" {key}={value}" for key, value in sorted(record.labels.items()))
+    if record.size_bytes is not None:
+        details += f" bytes={record.size_bytes}"
+    logger.info("%s %s in %.1f ms%s", record.name, record.outcome, record.duration * 1000, details)
+
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append(record)
+
+
+def start_request():
+    """Begin collecting stages for the current request; pass the token to finish_request()"""
+    return _request_stages.set([])
+
+
+def finish_request(token):
+    stages = _request_stages.get()
+    _request_stages.reset(token)
+    return stages or []
+
+
+def server_timing(stages, total=None):
+    """Server-Timing header value, e.g. enhance;dur=412.3;desc="ok", total;dur=530.0"""
+    entries = []
+    for record in stages:
+        desc = ' '.join([record.outcome] + [f"{key}={value}" for key, value in sorted(record.labels.items())])
+        entries.append(f'{record.name};dur={record.duration * 1000:.1f};desc="{desc}"')
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
@@ -1,16 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
+if settings.ASYNC_GENERATION_VIEWS:
+    from . import async_views as generation_views
+else:
+    generation_views = views
+
 urlpatterns = [
     path('', views.home, name='home'),
-    path('backgrounds/', views.backgrounds, name='backgrounds'),
-    path('characters/', views.characters, name='characters'),
-    path('create-scene/', views.create_scene, name='create_scene'),
+    path('backgrounds/', generation_views.backgrounds, name='backgrounds'),
+    path('characters/', generation_views.characters, name='characters'),
+    path('create-scene/', generation_views.create_scene, name='create_scene'),
     path('scene/<int:scene_id>/', views.scene_result, name='scene_result'),
     path('my-scenes/', views.my_scenes, name='my_scenes'),
+    path('feed/<str:kind>/', views.library_feed, name='library_feed'),
+    path('bulk/<str:kind>/', views.bulk_create, name='bulk_create'),
     path('delete-background/<int:bg_id>/', views.delete_background, name='delete_background'),
     path('delete-character/<int:char_id>/', views.delete_character, name='delete_character'),
+    path('jobs/<int:job_id>/variants/', views.job_variants, name='job_variants'),
+    path('jobs/<int:job_id>/status/', views.job_status, name='job_status'),
+    path('metrics/', views.metrics, name='metrics'),
     
     # Authentication URLs
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
@@ -1,11 +1,59 @@
+import json
+import logging
+from contextlib import closing
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.http import JsonResponse
-from .models import Background, Character, Scene
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.urls import reverse
+from . import admission, storage, thumbnails
+from .models import Background, Character, Scene, GenerationJob
 from .forms import BackgroundForm, CharacterForm, SceneForm, CustomUserCreationForm
-from .services import AIService, ImageGenerationService
+from .metrics import registry
+from .pagination import keyset_page
+from .services import BulkGenerationService, GenerationJobService, SceneCompositor
+
+
+logger = logging.getLogger(__name__)
+
+# Paginated card grids: queryset builder, card template and its context name
+LIBRARY_FEEDS = {
+    'backgrounds': (
+        lambda user: Background.objects.filter(created_by=user),
+        'composer/_background_card.html', 'background',
+    ),
+    'characters': (
+        lambda user: Character.objects.filter(created_by=user),
+        'composer/_character_card.html', 'character',
+    ),
+    'scenes': (
+        # Cards show the background and character names; join them up front
+        lambda user: Scene.objects.filter(created_by=user).select_related('background', 'character'),
+        'composer/_scene_card.html', 'scene',
+    ),
+}
+
+def _library_page(request, kind):
+    """One keyset page of the user's library for kind, plus the cursor for the next"""
+    queryset, _, _ = LIBRARY_FEEDS[kind]
+    return keyset_page(queryset(request.user), request.GET.get('cursor'), settings.GALLERY_PAGE_SIZE)
+
+def _too_many_requests(request, rejection, template, context):
+    """Re-render the form page with the rejection as a 429 the browser may retry"""
+    messages.error(request, str(rejection))
+    response = render(request, template, context, status=429)
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
+
+def _queued_variants(request, job, label):
+    """After a variants-mode submission: on to the page where the user picks one"""
+    messages.success(request, f'{label.title()} queued! Choose from its {job.options["variants"]} variants once they have been generated.')
+    return redirect('job_variants', job_id=job.id)
 
 def home(request):
     """Home page view"""
@@ -27,36 +75,30 @@ def signup(request):
 @login_required
 def backgrounds(request):
     """Background management view - Pure text to image"""
-    backgrounds = Background.objects.filter(created_by=request.user)
+    backgrounds, next_cursor = _library_page(request, 'backgrounds')
     
     if request.method == 'POST':
         form = BackgroundForm(request.POST)
         if form.is_valid():
+            variants = form.cleaned_data['variants']
+            try:
+                admission.admit(request.user, variants)
+            except admission.AdmissionRejected as e:
+                return _too_many_requests(request, e, 'composer/backgrounds.html', {
+                    'backgrounds': backgrounds,
+                    'next_cursor': next_cursor,
+                    'form': form
+                })
+
             background = form.save(commit=False)
             background.created_by = request.user
-            
-            # Always generate image from description
-            try:
-                ai_service = AIService()
-                enhanced_desc = ai_service.enhance_description(background.description)
-                print(f"Enhanced description: {enhanced_desc}")  # Debug
-                
-                image_url = ImageGenerationService.generate_background_image(enhanced_desc)
-                print(f"Generated image URL: {image_url}")  # Debug
-                
-                if image_url:
-                    background.generated_image_url = image_url
-                    background.save()
-                    messages.success(request, 'Background generated successfully!')
-                else:
-                    # Save without image and show error
-                    background.save()
-                    messages.error(request, 'Image generation failed. The background was saved but no image was generated. Please try again or try a different description.')
-                
-            except Exception as e:
-                print(f"Error in background generation: {e}")
-                background.save()
-                messages.error(request, f'An error occurred during image generation: {str(e)}')
+            background.save()
+
+            # Image generation runs in the worker; the card shows "Processing" until then
+            job = GenerationJobService.enqueue(background, request.user, variants=variants)
+            if variants > 1:
+                return _queued_variants(request, job, 'background')
+            messages.success(request, 'Background queued! Your image will appear here once it has been generated.')
             
             return redirect('backgrounds')
     else:
@@ -64,42 +106,37 @@ def backgrounds(request):
     
     return render(request, 'composer/backgrounds.html', {
         'backgrounds': backgrounds,
+        'next_cursor': next_cursor,
         'form': form
     })
 
 @login_required
 def characters(request):
     """Character management view - Pure text to image"""
-    characters = Character.objects.filter(created_by=request.user)
+    characters, next_cursor = _library_page(request, 'characters')
     
     if request.method == 'POST':
         form = CharacterForm(request.POST)
         if form.is_valid():
+            variants = form.cleaned_data['variants']
+            try:
+                admission.admit(request.user, variants)
+            except admission.AdmissionRejected as e:
+                return _too_many_requests(request, e, 'composer/characters.html', {
+                    'characters': characters,
+                    'next_cursor': next_cursor,
+                    'form': form
+                })
+
             character = form.save(commit=False)
             character.created_by = request.user
-            
-            # Always generate image from description using the improved service
-            try:
-                ai_service = AIService()
-                enhanced_desc = ai_service.enhance_description(character.description)
-                print(f"Enhanced character description: {enhanced_desc}")
-                
-                # Use the same multi-service approach as backgrounds
-                image_url = ImageGenerationService.generate_character_image(enhanced_desc)
-                print(f"Generated character image URL: {image_url}")
-                
-                if image_url:
-                    character.generated_image_url = image_url
-                    character.save()
-                    messages.success(request, 'Character generated successfully!')
-                else:
-                    character.save()
-                    messages.error(request, 'Image generation failed. The character was saved but no image was generated.')
-                
-            except Exception as e:
-                print(f"Error in character generation: {e}")
-                character.save()
-                messages.error(request, f'An error occurred during character generation: {str(e)}')
+            character.save()
+
+            # Image generation runs in the worker; the card shows "Processing" until then
+            job = GenerationJobService.enqueue(character, request.user, variants=variants)
+            if variants > 1:
+                return _queued_variants(request, job, 'character')
+            messages.success(request, 'Character queued! Your image will appear here once it has been generated.')
             
             return redirect('characters')
     else:
@@ -107,6 +144,7 @@ def characters(request):
     
     return render(request, 'composer/characters.html', {
         'characters': characters,
+        'next_cursor': next_cursor,
         'form': form
     })
 
@@ -117,26 +155,33 @@ def create_scene(request):
     if request.method == 'POST':
         form = SceneForm(request.user, request.POST)
         if form.is_valid():
+            variants = form.cleaned_data['variants']
+            try:
+                admission.admit(request.user, variants)
+            except admission.AdmissionRejected as e:
+                return _too_many_requests(request, e, 'composer/create_scene.html', {'form': form})
+
             scene = form.save(commit=False)
             scene.created_by = request.user
             
-            # Generate scene image
-            ai_service = AIService()
-            scene_prompt = ai_service.generate_scene_prompt(
-                scene.background.description,
-                scene.character.description,
-                scene.character_position,
-                scene.action_description
-            )
+            # Compositing existing images is quick enough to do inline
+            if scene.render_mode == Scene.RENDER_COMPOSITE:
+                scene.generated_image_url = SceneCompositor.compose(
+                    scene.background.image_url,
+                    scene.character.image_url,
+                    scene.character_position
+                )
+            scene.save()
             
-            image_url = ImageGenerationService.generate_image(scene_prompt)
-            if image_url:
-                scene.generated_image_url = image_url
-                scene.save()
+            if scene.generated_image_url:
                 messages.success(request, 'Scene created successfully!')
-                return redirect('scene_result', scene_id=scene.id)
             else:
-                messages.error(request, 'Failed to generate scene image. Please try again.')
+                # AI repaint (or sources still generating) runs in the worker; the result page polls for it
+                job = GenerationJobService.enqueue(scene, request.user, variants=variants)
+                if variants > 1:
+                    return _queued_variants(request, job, 'scene')
+                messages.success(request, 'Scene queued! The image will appear below once it has been generated.')
+            return redirect('scene_result', scene_id=scene.id)
         
     else:
         form = SceneForm(request.user)
@@ -147,13 +192,62 @@ def create_scene(request):
 def scene_result(request, scene_id):
     """Scene result display view"""
     scene = get_object_or_404(Scene, id=scene_id, created_by=request.user)
-    return render(request, 'composer/scene_result.html', {'scene': scene})
+    job = scene.generation_jobs.order_by('-created_at').first()
+    return render(request, 'composer/scene_result.html', {'scene': scene, 'job': job})
 
 @login_required
 def my_scenes(request):
     """User's scenes gallery view"""
-    scenes = Scene.objects.filter(created_by=request.user).order_by('-created_at')
-    return render(request, 'composer/my_scenes.html', {'scenes': scenes})
+    scenes, next_cursor = _library_page(request, 'scenes')
+    return render(request, 'composer/my_scenes.html', {'scenes': scenes, 'next_cursor': next_cursor})
+
+@login_required
+def library_feed(request, kind):
+    """Infinite-scroll JSON: the next page of cards as HTML plus its cursor"""
+    if kind not in LIBRARY_FEEDS:
+        raise Http404
+    _, card_template, name = LIBRARY_FEEDS[kind]
+    items, next_cursor = _library_page(request, kind)
+    html = ''.join(render_to_string(card_template, {name: item}, request=request) for item in items)
+    next_url = f"{reverse('library_feed', args=[kind])}?cursor={next_cursor}" if next_cursor else None
+    return JsonResponse({
+        'html': html,
+        'count': len(items),
+        'next_cursor': next_cursor,
+        'next_url': next_url,
+    })
+
+@login_required
+@require_POST
+def bulk_create(request, kind):
+    """Create many backgrounds or characters from a JSON body or an uploaded CSV,
+    streaming one JSON line of progress per item as it finishes"""
+    if kind not in BulkGenerationService.KINDS:
+        raise Http404
+    try:
+        if 'file' in request.FILES:
+            data, fmt = request.FILES['file'].read().decode('utf-8'), 'csv'
+        else:
+            data, fmt = request.body.decode('utf-8'), 'json'
+        items = BulkGenerationService.parse_items(data, fmt, max_items=settings.BULK_GENERATION_MAX_ITEMS)
+        # One token per item from the bulk allowance: a batch is no way around the rate limit
+        admission.admit_bulk(request.user, len(items))
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except admission.AdmissionRejected as e:
+        response = JsonResponse({'error': str(e)}, status=429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+
+    def progress():
+        # Closed along with the response, so a client that disconnects stops the batch
+        with closing(BulkGenerationService.run(kind, items, request.user)) as updates:
+            for update in updates:
+                yield json.dumps(update) + '\n'
+
+    response = StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'  # Let proxies pass each line through immediately
+    return response
 
 @login_required
 def delete_background(request, bg_id):
@@ -170,3 +264,61 @@ def delete_character(request, char_id):
     character.delete()
     messages.success(request, 'Character deleted successfully!')
     return redirect('characters')
+
+@login_required
+def job_variants(request, job_id):
+    """The images a variants-mode job generated; POST a seed to keep that one"""
+    job = get_object_or_404(GenerationJob, id=job_id, created_by=request.user)
+    target = job.target
+    if request.method == 'POST':
+        try:
+            variant = job.variant(int(request.POST.get('seed', '')))
+        except ValueError:
+            variant = None
+        if variant is None:
+            messages.error(request, 'That variant is not one of this generation\'s.')
+            return redirect('job_variants', job_id=job.id)
+
+        target.seed = variant['seed']
+        target.generated_image_url = variant['image_url']
+        target.save(update_fields=['seed', 'generated_image_url'])
+        # The rest are no longer on offer; let their files go like a deleted row's
+        unchosen = {other['image_url'] for other in job.variants} - {variant['image_url']}
+        job.variants = [variant]
+        job.save(update_fields=['variants'])
+        if settings.MEDIA_RELEASE_ON_DELETE:
+            for image_url in unchosen:
+                storage.release(image_url)
+        try:
+            thumbnails.build_derivatives(target.generated_image_url)
+        except Exception as e:
+            logger.warning("Thumbnail generation failed for %s: %s", target.generated_image_url, e)
+        messages.success(request, f'Kept the variant with seed {target.seed}.')
+        if job.kind == GenerationJob.KIND_SCENE:
+            return redirect('scene_result', scene_id=target.id)
+        return redirect(f'{job.kind}s')
+
+    return render(request, 'composer/job_variants.html', {'job': job, 'target': target})
+
+@login_required
+def job_status(request, job_id):
+    """Report the state of a generation job for polling clients"""
+    job = get_object_or_404(GenerationJob, id=job_id, created_by=request.user)
+    target = job.target
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'finished': job.is_finished,
+        'error': job.error,
+        'attempts': job.attempts,
+        'image_url': getattr(target, 'generated_image_url', None),
+        'seed': getattr(target, 'seed', None),
+        'variants': job.variants,
+    })
+
+def metrics(request):
+    """Prometheus scrape endpoint for this process's metrics"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4')
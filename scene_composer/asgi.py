@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scene_composer.settings')
 
 application = get_asgi_application()
+
+# Only server processes render placeholders; manage.py commands skip the warmup
+from composer import rendering  # noqa: E402
+
+rendering.start_warmup()
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'composer.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,10 +49,16 @@ TEMPLATES = [
     },
 ]
 
+# runserver loads this too, so the dev server warms placeholder layers like a deployed one
+WSGI_APPLICATION = 'scene_composer.wsgi.application'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Leases, rate-limit buckets and breaker state are small writes from every
+        # process; wait for SQLite's write lock rather than failing after 5s
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -69,7 +76,142 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # API Keys
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-POLLINATIONS_API_URL = 'https://image.pollinations.ai/prompt/'
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')  # Alternate Gemini host over REST, e.g. benchmarks/stubs.py
+POLLINATIONS_API_URL = os.getenv('POLLINATIONS_API_URL', 'https://image.pollinations.ai/prompt/')
+POLLINATIONS_RACE_MODELS = True  # Request the leading routes in parallel instead of one after another
+POLLINATIONS_RACE_WIDTH = 2  # routes raced per request
+POLLINATIONS_DEADLINE = 45  # seconds allowed for the whole provider attempt before falling back
+GEMINI_TIMEOUT = 20  # seconds per Gemini request (batched enhancement is not bounded)
+
+# Ways to generate an image (composer.routing): a Pollinations model, optionally on
+# another Pollinations-compatible endpoint such as the local stub in
+# benchmarks/stubs.py. Each request goes to the routes with the best rolling
+# latency and success rate at its image size; ROUTING_EXPLORATION of requests
+# give another route a try so a recovered one gets noticed.
+IMAGE_ROUTES = [
+    {'name': 'default', 'model': ''},
+    {'name': 'flux', 'model': 'flux'},
+    {'name': 'turbo', 'model': 'turbo'},
+]
+if os.getenv('IMAGE_STUB_URL'):
+    IMAGE_ROUTES.append({'name': 'stub', 'url': os.getenv('IMAGE_STUB_URL')})
+ROUTING_WINDOW = 50  # recent attempts per route and image size behind the stats
+ROUTING_MIN_SAMPLES = 3  # attempts before a route is ranked on its stats; untried routes go first
+ROUTING_EXPLORATION = 0.1
+
+# End-to-end budget in seconds for views that generate inline (the async views;
+# the queue-backed ones answer at once), by URL name (composer.deadlines). Each
+# stage sizes its timeout from what is left, Gemini is skipped when time is
+# short, and the placeholder is rendered as soon as the budget runs out.
+REQUEST_DEADLINES = {'backgrounds': 8, 'characters': 8, 'create_scene': 8}
+DEADLINE_IMAGE_RESERVE = 5  # seconds of a budget that Gemini calls leave for the image itself
+DEADLINE_PLACEHOLDER_RESERVE = 0.5  # seconds of a budget kept back for rendering the placeholder
+DEADLINE_MIN_STAGE = 1  # a stage with less than this left is skipped rather than started
+
+# Identical generations in flight at once share one provider call; across
+# processes the first caller holds a GenerationLease row (composer.singleflight)
+SINGLE_FLIGHT_LEASE = POLLINATIONS_DEADLINE + 15  # seconds before a silent holder's lease can be taken over
+SINGLE_FLIGHT_POLL_INTERVAL = 0.25  # seconds between checks on another process's call
+
+# Admission control for generation, shared across processes (composer.admission).
+# Each user has a token bucket; beyond it, and beyond the job backlog, requests get a 429.
+ADMISSION_USER_RATE = 0.2  # tokens refilled per second: one generation every 5s sustained
+ADMISSION_USER_BURST = 10  # generations a user may start back to back (0 disables the bucket)
+ADMISSION_MAX_PENDING_JOBS = 500  # queued jobs before new requests are refused (0 for no limit)
+# At most this many Pollinations generations (each possibly racing several models)
+# in flight at once (0 for no limit). Callers wait in a bounded queue for a slot;
+# inline requests that still miss out are deferred to the job queue
+ADMISSION_PROVIDER_CONCURRENCY = 16
+ADMISSION_QUEUE_SIZE = 32
+ADMISSION_QUEUE_TIMEOUT = 10  # seconds a caller waits for a slot
+ADMISSION_SLOT_LEASE = POLLINATIONS_DEADLINE + 15  # seconds before a crashed holder's slot is reclaimed
+ADMISSION_POLL_INTERVAL = 0.25
+
+# Under ASGI, serve backgrounds/characters/create-scene from composer.async_views,
+# which generate inline without holding a thread. Leave off for WSGI, where the
+# views queue work for `run_generation_worker` instead.
+ASYNC_GENERATION_VIEWS = os.getenv('ASYNC_GENERATION_VIEWS', '') == '1'
+ASYNC_HTTP_MAX_CONNECTIONS = 200  # open provider connections per event loop (composer.async_http_client)
+
+# Shared outbound HTTP session (composer.http_client)
+HTTP_POOL_CONNECTIONS = 10  # hosts kept in the default pool
+HTTP_POOL_MAXSIZE = 10  # keep-alive connections per host
+HTTP_HOST_POOL_SIZES = {
+    'image.pollinations.ai': 32,
+}
+HTTP_DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+HTTP_HOST_TIMEOUTS = {
+    'image.pollinations.ai': (5, 30),
+}
+HTTP_RETRY_TOTAL = 2
+HTTP_RETRY_STATUSES = [429, 502, 503, 504]
+HTTP_RETRY_BACKOFF = 0.5  # seconds, doubled per retry
+HTTP_RETRY_JITTER = 0.5  # up to this many random seconds added to each backoff
+HTTP_RETRY_MAX_SLEEP = 5  # seconds; longest Retry-After honoured, and never past the caller's timeout
+
+# Provider image downloads: streamed to a temp file, validated, then renamed into place
+DOWNLOAD_MAX_BYTES = 20 * 1024 ** 2
+DOWNLOAD_MIN_BYTES = 1000
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_VERIFY_DIMENSIONS = True  # Reject images whose size differs from the one requested
+
+# Provider circuit breaker, shared across processes through the database
+CIRCUIT_BREAKER_WINDOW = 60  # seconds of history used for the failure rate
+CIRCUIT_BREAKER_MIN_CALLS = 5  # calls in the window before the breaker may trip
+CIRCUIT_BREAKER_FAILURE_RATE = 0.5
+CIRCUIT_BREAKER_COOLDOWN = 30  # seconds open before a half-open probe
+
+# Pre-rendered placeholder base layers (about 2.3 MB each at 1024x768)
+PLACEHOLDER_BASE_CACHE_SIZE = 32
+PLACEHOLDER_WARM_ON_STARTUP = True  # in server and worker processes only, not other manage.py commands
+
+# Generated media layout and cleanup (see composer.storage and `manage.py sweep_media`)
+MEDIA_SHARD_DEPTH = 2  # generated_images/ab/cd/<file>
+MEDIA_RELEASE_ON_DELETE = True  # Remove a file as soon as its last row is deleted
+MEDIA_SWEEP_MIN_AGE = 3600  # seconds; younger files may belong to an in-flight generation
+
+AI_ENHANCE_BATCH_SIZE = 50  # descriptions per structured Gemini request (AIService.enhance_descriptions)
+
+# Bulk background/character creation (`manage.py bulk_generate` and /bulk/<kind>/)
+BULK_GENERATION_WORKERS = 4  # items enhanced and generated at the same time
+BULK_GENERATION_BATCH_SIZE = 20  # rows per bulk_create
+BULK_GENERATION_MAX_ITEMS = 200  # per web request; the command has no limit
+# Bulk web imports draw on a token bucket of their own, one token per item, so a
+# full-sized import fits; it refills a full import's worth an hour (0 disables it)
+ADMISSION_BULK_BURST = BULK_GENERATION_MAX_ITEMS
+ADMISSION_BULK_RATE = ADMISSION_BULK_BURST / 3600
+
+# Variants mode: one submission generates this many seeds of the same prompt in
+# parallel (in the worker) and the user picks the one to keep
+GENERATION_MAX_VARIANTS = 4
+
+# Cards per page on the library and gallery pages (keyset paginated)
+GALLERY_PAGE_SIZE = 24
+
+# Gallery thumbnails written under MEDIA_ROOT/derivatives (see composer.thumbnails)
+THUMBNAIL_WIDTHS = [320, 640]
+THUMBNAIL_SIZES = '(max-width: 768px) 100vw, 360px'
+
+# Clients allowed to scrape /metrics/
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Report per-stage generation timings (Gemini, each Pollinations attempt, file
+# writes, placeholder renders) in a Server-Timing response header. Stage names
+# and durations are visible to clients, so it is off unless debugging.
+SERVER_TIMING_HEADER = DEBUG
+
+# Background generation queue (run with `python manage.py run_generation_worker`)
+GENERATION_WORKER_POLL_INTERVAL = 2  # seconds between polls of an empty queue
+GENERATION_JOB_MAX_ATTEMPTS = 3
+GENERATION_JOB_STALE_AFTER = 300  # seconds before a running job is assumed dead
+
+# Cache of provider images (prune with `python manage.py prune_image_cache`); 0 disables a limit
+IMAGE_CACHE_MAX_AGE = 30 * 24 * 3600  # seconds since last use
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Memoized Gemini responses: per-process LRU in front of the CachedPrompt table
+PROMPT_CACHE_TTL = 7 * 24 * 3600  # seconds
+PROMPT_CACHE_MEMORY_SIZE = 512  # entries per process
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -100,19 +242,7 @@ LOGGING = {
     },
 }
 
-# Create media directories on startup
-def ensure_media_directories():
-    """Ensure media directories exist"""
-    directories = [
-        MEDIA_ROOT,
-        MEDIA_ROOT / 'generated_images',
-        MEDIA_ROOT / 'backgrounds',
-        MEDIA_ROOT / 'characters',
-        BASE_DIR / 'static'
-    ]
-    
-    for directory in directories:
-        os.makedirs(directory, exist_ok=True)
-
-# Create directories when settings are loaded
-ensure_media_directories()
+# Media directories are not created here: settings are imported by every
+# worker boot and manage.py run, and each writer (composer.storage,
+# composer.downloads, composer.thumbnails, FileSystemStorage for uploads)
+# creates the directory it needs on first write.
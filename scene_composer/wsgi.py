@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scene_composer.settings')
 
 application = get_wsgi_application()
+
+# Only server processes render placeholders; manage.py commands skip the warmup
+from composer import rendering  # noqa: E402
+
+rendering.start_warmup()